@@ -0,0 +1,252 @@
+from flask import request
+from flask_socketio import Namespace
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from deercode.agents.session_manager import AdmissionError, SessionBusyError, SessionManager, SessionOwnershipError
+from contextlib import closing
+import threading
+import time
+import uuid
+
+# 工具输出可能很大，推送给前端时只保留前面一部分
+TOOL_OUTPUT_PREVIEW_CHARS = 2000
+
+# 取消运行时，为尚未返回结果的工具调用补上的内容
+CANCELLED_TOOL_OUTPUT = 'Cancelled by the user before the tool finished.'
+
+
+class TokenBatcher:
+    """
+    合并细碎的 token，按时间或字符数批量推送，减少 socket 消息数量
+
+    缓冲区中有内容时会启动定时器，即使之后只收到空 chunk（例如模型开始输出工具调用参数），
+    文本最迟在 flush_interval 之后也会推送
+    """
+
+    def __init__(self, send, flush_interval=0.05, max_chars=256):
+        self.send = send
+        self.flush_interval = flush_interval
+        self.max_chars = max_chars
+        self.buffer = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def append(self, text):
+        with self._lock:
+            if text:
+                self.buffer.append(text)
+                self.size += len(text)
+            if not self.buffer:
+                return
+            if self.size < self.max_chars and time.monotonic() - self.last_flush < self.flush_interval:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_interval, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            text = ''.join(self.buffer)
+            self.buffer = []
+            self.size = 0
+            self.last_flush = time.monotonic()
+            # 在锁内发送，保证定时器线程和 agent 线程推送的文本顺序不会交错
+            if text:
+                self.send(text)
+
+    def close(self):
+        self.flush()
+
+
+class AgentNamespace(Namespace):
+    """
+    运行 coding agent，并实时推送 token、工具调用和 TODO 更新
+
+    每个 thread_id 对应一个独立的会话和工作目录，运行通过 SessionManager 的有界线程池调度
+
+    客户端事件：
+        run: {'message': str, 'thread_id': 可选，只能是本连接创建的会话, 'cwd': 可选，相对于工作区根目录}
+        cancel: {'run_id': str}
+    服务端事件：
+        agent_started, token, tool_start, tool_end, todo_update, checkpoint, agent_done, agent_error
+    """
+
+    def __init__(self, namespace='/agent', workspace_root=None, session_manager=None,
+                 snapshot_store=None, flush_interval=0.05, max_chars=256):
+        super().__init__(namespace)
+        self.workspace_root = workspace_root
+        self.snapshot_store = snapshot_store
+        self.flush_interval = flush_interval
+        self.max_chars = max_chars
+        self._session_manager = session_manager
+        self._session_manager_lock = threading.Lock()
+        # 运行中的 run_id -> 发起运行的客户端 sid，只接受本人对运行中任务的取消
+        self._active_runs = {}
+        self._cancelled = set()
+        self._runs_lock = threading.Lock()
+
+    @property
+    def sessions(self):
+        # 懒加载，避免导入 app 时就创建 agent；加锁避免并发的首次请求各自创建 agent 和线程池
+        with self._session_manager_lock:
+            if self._session_manager is None:
+                self._session_manager = SessionManager()
+            return self._session_manager
+
+    def on_connect(self):
+        print(f'Agent 客户端已连接: {request.sid}')
+
+    def on_disconnect(self, reason=None):
+        print(f'Agent 客户端已断开连接: {request.sid}')
+        # 会话只属于创建它的连接，断开后释放空闲会话及其对话历史
+        if self._session_manager is not None:
+            self._session_manager.close_owner_sessions(request.sid)
+
+    def on_run(self, data):
+        message = (data or {}).get('message', '')
+        if not message:
+            self.emit('agent_error', {'error': '请输入有效的消息'}, room=request.sid)
+            return
+        run_id = str(uuid.uuid4())
+        thread_id = data.get('thread_id') or run_id
+        try:
+            # 会话绑定到创建它的连接，其他客户端不能通过 thread_id 继续或读取该会话
+            self.sessions.get_or_create_session(thread_id, self.workspace_root, data.get('cwd'), owner=request.sid)
+        except (ValueError, SessionOwnershipError) as e:
+            self.emit('agent_error', {'error': str(e)}, room=request.sid)
+            return
+        with self._runs_lock:
+            self._active_runs[run_id] = request.sid
+        try:
+            self.sessions.submit(thread_id, self._run_agent, request.sid, run_id, message)
+        except (AdmissionError, SessionBusyError) as e:
+            self._finish_run(run_id)
+            self.emit('agent_error', {'error': str(e), 'busy': True}, room=request.sid)
+            return
+        return {'run_id': run_id, 'thread_id': thread_id}
+
+    def on_cancel(self, data):
+        run_id = (data or {}).get('run_id')
+        with self._runs_lock:
+            if run_id and self._active_runs.get(run_id) == request.sid:
+                self._cancelled.add(run_id)
+
+    def _finish_run(self, run_id):
+        with self._runs_lock:
+            self._active_runs.pop(run_id, None)
+            self._cancelled.discard(run_id)
+
+    def _close_open_tool_calls(self, session):
+        """
+        为最后一条 AIMessage 中没有结果的工具调用补上取消消息，
+        否则下一轮对话会带着不完整的 tool_calls 调用模型，被 OpenAI 兼容接口拒绝
+
+        已经执行完但尚未提交的节点结果（pending writes）在新的输入到来时会被丢弃，
+        因此把这条 AIMessage 和已有的工具结果与取消消息一起写回 checkpoint
+        """
+        agent = self.sessions.agent
+        messages = agent.get_state(session.config).values.get('messages', [])
+        last_index = next((i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], AIMessage)), None)
+        if last_index is None or not messages[last_index].tool_calls:
+            return []
+        last_ai = messages[last_index]
+        finished = [msg for msg in messages[last_index + 1:] if isinstance(msg, ToolMessage)]
+        answered = {msg.tool_call_id for msg in finished}
+        cancelled = [
+            ToolMessage(CANCELLED_TOOL_OUTPUT, tool_call_id=tool_call['id'], name=tool_call['name'], status='error')
+            for tool_call in last_ai.tool_calls if tool_call['id'] not in answered
+        ]
+        # 相同 id 的消息会被替换，重复写入已提交的消息不会产生重复
+        agent.update_state(session.config, {'messages': [last_ai, *finished, *cancelled]}, as_node='tools')
+        return finished + cancelled
+
+    def _run_agent(self, session, sid, run_id, message):
+        def send(event, payload):
+            payload['run_id'] = run_id
+            self.emit(event, payload, room=sid)
+
+        batcher = TokenBatcher(
+            lambda text: send('token', {'text': text}),
+            flush_interval=self.flush_interval,
+            max_chars=self.max_chars,
+        )
+        # tool_call_id -> 工具名称，用于 tool_end 事件
+        pending_tools = {}
+
+        send('agent_started', {'thread_id': session.thread_id})
+        cancelled = False
+        try:
+            stream = self.sessions.agent.stream(
+                {'messages': [{'role': 'user', 'content': message}]},
+                config=session.config,
+                context=session.context,
+                stream_mode=['messages', 'updates', 'checkpoints'],
+            )
+            # 提前退出时关闭生成器，停止图的执行后再修补 checkpoint
+            with closing(stream):
+                for mode, chunk in stream:
+                    if run_id in self._cancelled:
+                        cancelled = True
+                        break
+
+                    if mode == 'messages':
+                        msg, metadata = chunk
+                        if isinstance(msg, AIMessageChunk) and metadata.get('langgraph_node') == 'model':
+                            batcher.append(msg.text)
+                        continue
+
+                    if mode == 'checkpoints':
+                        # 每个 checkpoint 记录一次工作区快照，回滚时使用同一个 checkpoint_id
+                        # 工具返回前会等待文件监控器追上，它写入的文件已上报并归属于本会话
+                        if self.snapshot_store is not None:
+                            checkpoint_id = chunk['config']['configurable']['checkpoint_id']
+                            changes = self.snapshot_store.snapshot(checkpoint_id, thread_id=session.thread_id)
+                            send('checkpoint', {'checkpoint_id': checkpoint_id, 'changes': len(changes)})
+                        continue
+
+                    # updates 模式：每个节点执行完成后的状态增量
+                    batcher.flush()
+                    for update in chunk.values():
+                        update = update or {}
+                        if 'todos' in update:
+                            send('todo_update', {'items': update['todos']})
+                        for msg in update.get('messages', []):
+                            if isinstance(msg, AIMessage):
+                                for tool_call in msg.tool_calls:
+                                    pending_tools[tool_call['id']] = tool_call['name']
+                                    send('tool_start', {
+                                        'id': tool_call['id'],
+                                        'name': tool_call['name'],
+                                        'args': tool_call['args'],
+                                    })
+                            elif isinstance(msg, ToolMessage):
+                                send('tool_end', self._tool_end_payload(msg, pending_tools))
+            batcher.flush()
+            if cancelled:
+                for msg in self._close_open_tool_calls(session):
+                    if msg.tool_call_id in pending_tools:
+                        send('tool_end', self._tool_end_payload(msg, pending_tools))
+            send('agent_done', {'cancelled': cancelled})
+        except Exception as e:
+            batcher.flush()
+            send('agent_error', {'error': str(e)})
+        finally:
+            batcher.close()
+            self._finish_run(run_id)
+
+    @staticmethod
+    def _tool_end_payload(msg, pending_tools):
+        output = msg.content if isinstance(msg.content, str) else str(msg.content)
+        return {
+            'id': msg.tool_call_id,
+            'name': pending_tools.pop(msg.tool_call_id, msg.name),
+            'status': msg.status,
+            'output': output[:TOOL_OUTPUT_PREVIEW_CHARS],
+            'truncated': len(output) > TOOL_OUTPUT_PREVIEW_CHARS,
+        }
@@ -5,15 +5,35 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import os
 import json
+import logging
+import shutil
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from agent_namespace import AgentNamespace
+from deercode.snapshots.snapshot_store import SnapshotConflictError, get_snapshot_store
+from deercode.symbols.symbol_index import get_symbol_index
+from deercode.tools.listing import list_directory
+from encoding import init_compression, negotiate_tree_format, to_columnar, tree_response
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)  # 允许所有跨域请求
 
+# 压缩超过阈值的 HTTP 响应（按 Accept-Encoding 选择 zstd 或 gzip）
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+init_compression(app, min_size=COMPRESSION_MIN_SIZE)
+
 # 初始化SocketIO
+# 轮询传输按阈值进行 gzip/deflate 压缩；WebSocket 传输由 simple-websocket 协商 permessage-deflate
 app.config['SECRET_KEY'] = 'your-secret-key'
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    http_compression=True,
+    compression_threshold=COMPRESSION_MIN_SIZE,
+)
 
 # 设置codespace目录为根目录
 CODESPACE_DIR = '/Users/bytedance/Desktop/wqs/deercode/src/codespace'
@@ -22,6 +42,17 @@ CODESPACE_DIR = '/Users/bytedance/Desktop/wqs/deercode/src/codespace'
 if not os.path.exists(CODESPACE_DIR):
     os.makedirs(CODESPACE_DIR)
 
+# 工作区快照，按 agent checkpoint 记录变更的文件，用于回滚；存储位于工作区之外
+# 只有一个会话的工具在执行时，监控器上报的变化归属于该会话；文件接口和来源不明的变化单独记录
+snapshot_store = get_snapshot_store(CODESPACE_DIR)
+
+# 符号索引，由文件监控器增量更新，agent 的 symbols 工具共用同一个索引
+symbol_index = get_symbol_index(CODESPACE_DIR)
+
+# 注册 agent 流式推送通道，每个会话的工作区都位于codespace目录下
+agent_namespace = AgentNamespace('/agent', workspace_root=CODESPACE_DIR, snapshot_store=snapshot_store)
+socketio.on_namespace(agent_namespace)
+
 # 文件系统事件处理器
 class FileSystemChangeHandler(FileSystemEventHandler):
     def __init__(self):
@@ -29,8 +60,49 @@ class FileSystemChangeHandler(FileSystemEventHandler):
         self.last_event_time = {}
         self.throttle_delay = 1.0  # 1秒节流延迟，增加延迟时间
         self.last_event_details = {}  # 记录事件详情，避免重复事件
+        self.suppressions = {}  # 进行中的批量操作 -> (涉及的路径, 屏蔽截止时间，None 表示批量操作尚未结束)
+        self.suppress_lock = threading.Lock()
+    
+    def suppress(self, relative_paths):
+        """
+        批量操作期间不推送这些路径（及其父目录、子路径）的变化事件，由调用方统一发送合并后的通知
+        返回的 token 需要在批量操作结束后传给 release
+        """
+        token = object()
+        with self.suppress_lock:
+            self.suppressions[token] = ([p.strip('/') for p in relative_paths], None)
+        return token
+    
+    def release(self, token, grace=0.0):
+        """
+        结束屏蔽；grace 秒内仍屏蔽这些路径，用于合并批量操作中延迟到达的事件
+        """
+        with self.suppress_lock:
+            if token in self.suppressions:
+                self.suppressions[token] = (self.suppressions[token][0], time.time() + grace)
+    
+    def is_suppressed(self, relative_path):
+        current_time = time.time()
+        with self.suppress_lock:
+            for token, (paths, expires_at) in list(self.suppressions.items()):
+                if expires_at is not None and expires_at < current_time:
+                    del self.suppressions[token]
+                    continue
+                for path in paths:
+                    if (path == relative_path or path.startswith(relative_path + '/')
+                            or relative_path.startswith(path + '/') or os.path.dirname(path) == relative_path):
+                        return True
+        return False
     
     def on_any_event(self, event):
+        # 在任何过滤之前记录变化的路径：隐藏文件（如 .env）同样需要快照，
+        # 先写隐藏临时文件再重命名的原子保存也要记录目标路径
+        snapshot_store.report_event(event.src_path)
+        symbol_index.mark_dirty(event.src_path)
+        if getattr(event, 'dest_path', None):
+            snapshot_store.report_event(event.dest_path)
+            symbol_index.mark_dirty(event.dest_path)
+        
         # 忽略临时文件和隐藏文件
         if event.src_path.endswith('.swp') or event.src_path.endswith('~') or os.path.basename(event.src_path).startswith('.'):
             return
@@ -41,6 +113,10 @@ class FileSystemChangeHandler(FileSystemEventHandler):
         else:
             return
         
+        # 批量操作期间的事件由批量接口合并后统一推送
+        if self.is_suppressed(relative_path):
+            return
+        
         # 节流处理，避免短时间内重复事件
         current_time = time.time()
         if relative_path in self.last_event_time:
@@ -84,41 +160,65 @@ class FileSystemChangeHandler(FileSystemEventHandler):
 event_handler = FileSystemChangeHandler()
 observer = Observer()
 
-# WebSocket事件处理
-@socketio.on('connect')
-def handle_connect():
-    print('客户端已连接')
-    emit('connection_established', {'message': '连接成功'})
-    
-    # 发送当前文件树
-    try:
-        entries = os.listdir(CODESPACE_DIR)
-        file_tree = []
-        for entry in entries:
-            entry_path = os.path.join(CODESPACE_DIR, entry)
-            if os.path.isdir(entry_path):
+def build_file_entries(entries, path):
+    """
+    将目录条目转换为文件树节点，只对传入的条目调用 stat
+    """
+    file_tree = []
+    for entry in entries:
+        # 修复路径生成逻辑，确保返回的相对路径不包含多余的斜杠
+        if path == '/' or path == '':
+            relative_path = entry.name
+        else:
+            relative_path = os.path.join(path, entry.name)
+        
+        try:
+            if entry.is_dir():
+                # 目录
                 file_tree.append({
-                    'name': entry,
+                    'name': entry.name,
                     'type': 'dir',
-                    'path': entry,
+                    'path': relative_path,
                     'children': []
                 })
             else:
+                # 文件
+                stat = entry.stat()
                 file_tree.append({
-                    'name': entry,
+                    'name': entry.name,
                     'type': 'file',
-                    'path': entry,
-                    'size': os.path.getsize(entry_path),
-                    'modified': os.path.getmtime(entry_path)
+                    'path': relative_path,
+                    'size': stat.st_size,
+                    'modified': stat.st_mtime
                 })
-        file_tree.sort(key=lambda x: (x['type'] != 'dir', x['name']))
-        emit('file_tree', {'files': file_tree})
+        except OSError:
+            # 文件在列出后被删除，跳过
+            continue
+    return file_tree
+
+# 终端会话的当前目录，按客户端 sid 区分
+terminal_cwd = {}
+
+# WebSocket事件处理
+@socketio.on('connect')
+def handle_connect():
+    print('客户端已连接')
+    emit('connection_established', {'message': '连接成功'})
+    
+    # 发送当前文件树，客户端可以通过连接参数 tree_format=columnar 请求列式结构
+    try:
+        file_tree = build_file_entries(list_directory(CODESPACE_DIR).entries, '')
+        if request.args.get('tree_format') == 'columnar':
+            emit('file_tree', to_columnar(file_tree))
+        else:
+            emit('file_tree', {'files': file_tree})
     except Exception as e:
         print(f"发送初始文件树失败: {e}")
 
 @socketio.on('disconnect')
 def handle_disconnect():
     print('客户端已断开连接')
+    terminal_cwd.pop(request.sid, None)
 
 @socketio.on('execute_command')
 def handle_execute_command(data):
@@ -140,19 +240,25 @@ def handle_execute_command(data):
         # 解析命令
         if command.startswith('cd '):
             # 处理cd命令
+            # 每个客户端维护自己的当前目录，不修改进程全局的 cwd，避免影响其他会话
             new_dir = command[3:].strip()
+            current_dir = terminal_cwd.get(request.sid, CODESPACE_DIR)
             if new_dir:
-                import os
-                os.chdir(new_dir)
-                emit('command_output', {'output': f'切换到目录: {new_dir}'})
+                target_dir = os.path.normpath(os.path.join(current_dir, os.path.expanduser(new_dir)))
+                if not os.path.isdir(target_dir):
+                    emit('command_output', {'output': f'目录不存在: {new_dir}', 'is_error': True})
+                else:
+                    terminal_cwd[request.sid] = target_dir
+                    emit('command_output', {'output': f'切换到目录: {new_dir}'})
             else:
-                emit('command_output', {'output': f'当前目录: {os.getcwd()}'})
+                emit('command_output', {'output': f'当前目录: {current_dir}'})
             emit('command_done')
             return
         
         # 执行命令
         process = subprocess.Popen(
             shlex.split(command),
+            cwd=terminal_cwd.get(request.sid, CODESPACE_DIR),
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             text=True,
@@ -183,11 +289,16 @@ def get_files():
     获取文件树结构
     参数：
         path: 可选，要获取的目录路径，默认为根目录
+        limit: 可选，每页返回的条目数，默认返回全部
+        cursor: 可选，上一页返回的 next_cursor
+        filter: 可选，按名称过滤，支持通配符，否则为不区分大小写的子串匹配
+        sort: 可选，name（默认）、name_desc、modified、size
+        format: 可选，json（默认）、columnar（列式 JSON）、msgpack（列式 MessagePack），
+                也可以通过 Accept: application/x-msgpack 请求 msgpack
     """
     path = request.args.get('path', '')
-    print(f"[DEBUG] 获取文件列表请求，path: {path}")
+    logger.debug("获取文件列表请求，path: %s", path)
     full_path = os.path.join(CODESPACE_DIR, path.lstrip('/'))
-    print(f"[DEBUG] 完整路径: {full_path}")
     
     # 检查路径是否存在
     if not os.path.exists(full_path):
@@ -197,44 +308,230 @@ def get_files():
     if not os.path.isdir(full_path):
         return jsonify({'error': '不是目录'}), 400
     
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return jsonify({'error': 'limit 必须大于 0'}), 400
+    
     try:
-        # 获取目录下的所有文件和子目录
-        entries = os.listdir(full_path)
-        file_tree = []
-        
-        for entry in entries:
-            entry_path = os.path.join(full_path, entry)
-            # 修复路径生成逻辑，确保返回的相对路径不包含多余的斜杠
-            if path == '/' or path == '':
-                relative_path = entry
+        # 排序和分页只依赖 scandir 的结果，stat 只针对当前页的文件
+        page = list_directory(
+            full_path,
+            limit=limit,
+            cursor=request.args.get('cursor') or None,
+            name_filter=request.args.get('filter') or None,
+            sort=request.args.get('sort', 'name'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    file_tree = build_file_entries(page.entries, path)
+    
+    logger.debug("返回 %d/%d 个条目，path: %s", len(file_tree), page.total, path)
+    return tree_response(
+        file_tree,
+        base_path=path,
+        tree_format=negotiate_tree_format(),
+        next_cursor=page.next_cursor,
+        total=page.total
+    )
+
+# 批量文件操作的线程池，限制并行 I/O 的数量
+FILE_BATCH_WORKERS = int(os.getenv('FILE_BATCH_WORKERS', 8))
+FILE_BATCH_MAX_OPERATIONS = int(os.getenv('FILE_BATCH_MAX_OPERATIONS', 500))
+batch_executor = ThreadPoolExecutor(max_workers=FILE_BATCH_WORKERS, thread_name_prefix='file-batch')
+
+def resolve_workspace_path(*parts):
+    """
+    返回工作区内路径的绝对路径；按符号链接解析后是工作区根目录本身或位于工作区之外时返回 None
+    """
+    full_path = os.path.normpath(os.path.join(CODESPACE_DIR, *(part.lstrip('/') for part in parts)))
+    root = os.path.realpath(CODESPACE_DIR)
+    real_path = os.path.realpath(full_path)
+    if real_path == root or os.path.commonpath([root, real_path]) != root:
+        return None
+    return full_path
+
+def validate_batch_operation(operation):
+    """
+    检查单个批量操作的结构和涉及的路径，返回错误信息，合法时返回 None
+    所有操作执行前统一检查，任何路径都不能是工作区根目录或位于工作区之外
+    """
+    if not isinstance(operation, dict):
+        return '操作必须是 JSON 对象'
+    for key in ('op', 'path', 'name', 'new_name', 'content'):
+        if operation.get(key) is not None and not isinstance(operation[key], str):
+            return f'{key} 必须是字符串'
+    op = operation.get('op')
+    if op not in ('read', 'create', 'write', 'rename', 'delete'):
+        return f'不支持的操作: {op}'
+    path = operation.get('path') or ''
+    if op != 'create' and not path.strip('/'):
+        return 'path 不能为空'
+    if op == 'create' and not operation.get('name'):
+        return '文件名不能为空'
+    if op == 'rename' and not operation.get('new_name'):
+        return '新文件名不能为空'
+    if op == 'create':
+        targets = [(path, operation['name'])]
+    elif op == 'rename':
+        targets = [(path,), (os.path.dirname(path.strip('/')), operation['new_name'])]
+    else:
+        targets = [(path,)]
+    for parts in targets:
+        if resolve_workspace_path(*parts) is None:
+            return f'路径无效: {os.path.join(*parts)}'
+    return None
+
+def batch_operation_paths(operation):
+    """
+    返回一个批量操作涉及的相对路径，用于判断操作之间的依赖关系
+    """
+    op = operation.get('op')
+    path = (operation.get('path') or '').strip('/')
+    if op == 'create':
+        return [os.path.join(path, operation.get('name', '')).strip('/')]
+    if op == 'rename':
+        return [path, os.path.join(os.path.dirname(path), operation.get('new_name', '')).strip('/')]
+    return [path]
+
+def paths_overlap(a, b):
+    return a == b or a.startswith(b + '/') or b.startswith(a + '/') or a == '' or b == ''
+
+def plan_batch_waves(operations):
+    """
+    将操作划分为若干批次：同一批次内的操作互不影响，可以并行执行；
+    与前面操作路径重叠（相同、父目录或子路径）的操作放到下一批次，保证执行顺序
+    """
+    waves = []
+    current_wave = []
+    current_paths = []
+    for index, operation in enumerate(operations):
+        paths = batch_operation_paths(operation)
+        if any(paths_overlap(a, b) for a in paths for b in current_paths):
+            waves.append(current_wave)
+            current_wave = []
+            current_paths = []
+        current_wave.append(index)
+        current_paths.extend(paths)
+    if current_wave:
+        waves.append(current_wave)
+    return waves
+
+def run_batch_operation(operation):
+    """
+    执行单个批量操作，返回结果和对应的变化事件
+    """
+    op = operation.get('op')
+    path = (operation.get('path') or '').lstrip('/')
+    result = {'op': op, 'path': path}
+    change = None
+    try:
+        if op == 'read':
+            full_path = resolve_workspace_path(path)
+            if not os.path.isfile(full_path):
+                raise FileNotFoundError('文件不存在')
+            with open(full_path, 'r', encoding='utf-8') as f:
+                result['content'] = f.read()
+        elif op == 'create':
+            name = operation.get('name', '')
+            if not name:
+                raise ValueError('文件名不能为空')
+            full_path = resolve_workspace_path(path, name)
+            if operation.get('is_dir', False):
+                os.makedirs(full_path, exist_ok=True)
             else:
-                relative_path = os.path.join(path, entry)
-            
-            if os.path.isdir(entry_path):
-                # 目录
-                file_tree.append({
-                    'name': entry,
-                    'type': 'dir',
-                    'path': relative_path,
-                    'children': []
-                })
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                with open(full_path, 'w', encoding='utf-8') as f:
+                    f.write(operation.get('content', ''))
+            result['path'] = os.path.join(path, name)
+            change = {'type': 'created', 'path': result['path']}
+        elif op == 'write':
+            full_path = resolve_workspace_path(path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'w', encoding='utf-8') as f:
+                f.write(operation.get('content', ''))
+            change = {'type': 'modified', 'path': path}
+        elif op == 'rename':
+            new_name = operation.get('new_name', '')
+            if not new_name:
+                raise ValueError('新文件名不能为空')
+            old_full_path = resolve_workspace_path(path)
+            if not os.path.exists(old_full_path):
+                raise FileNotFoundError('文件或目录不存在')
+            new_full_path = resolve_workspace_path(os.path.dirname(path.strip('/')), new_name)
+            os.rename(old_full_path, new_full_path)
+            snapshot_store.mark_dirty(old_full_path)
+            full_path = new_full_path
+            change = {'type': 'moved', 'path': path, 'dest_path': os.path.join(os.path.dirname(path), new_name)}
+        elif op == 'delete':
+            full_path = resolve_workspace_path(path)
+            if not os.path.exists(full_path):
+                raise FileNotFoundError('文件不存在')
+            if os.path.isdir(full_path):
+                shutil.rmtree(full_path)
             else:
-                # 文件
-                file_tree.append({
-                    'name': entry,
-                    'type': 'file',
-                    'path': relative_path,
-                    'size': os.path.getsize(entry_path),
-                    'modified': os.path.getmtime(entry_path)
-                })
-        
-        # 按名称排序，目录在前，文件在后
-        file_tree.sort(key=lambda x: (x['type'] != 'dir', x['name']))
-        
-        print(f"[DEBUG] 返回文件列表: {file_tree}")
-        return jsonify({'files': file_tree})
+                os.remove(full_path)
+            change = {'type': 'deleted', 'path': path}
+        else:
+            raise ValueError(f'不支持的操作: {op}')
+        if change is not None:
+            snapshot_store.mark_dirty(full_path)
+        result['success'] = True
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        result['success'] = False
+        result['error'] = str(e)
+    return result, change
+
+@app.route('/api/files/batch', methods=['POST'])
+def batch_files():
+    """
+    批量执行文件操作，一次请求完成多个读取、创建、写入、重命名和删除
+    请求体：
+        operations: 操作列表，每项包含 op（read/create/write/rename/delete）以及对应参数：
+            read/write/delete: path；write 需要 content
+            create: path（父目录）、name、is_dir、content
+            rename: path、new_name
+    返回按请求顺序排列的每项结果，所有修改完成后只推送一次合并的 file_change 事件
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': '请求体必须是 JSON 对象'}), 400
+    operations = data.get('operations', [])
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'operations 不能为空'}), 400
+    if len(operations) > FILE_BATCH_MAX_OPERATIONS:
+        return jsonify({'error': f'一次最多执行 {FILE_BATCH_MAX_OPERATIONS} 个操作'}), 400
+    for index, operation in enumerate(operations):
+        error = validate_batch_operation(operation)
+        if error:
+            return jsonify({'error': f'第 {index + 1} 个操作无效: {error}'}), 400
+    
+    # 屏蔽监控器对这些路径的逐条推送，直到批量操作结束
+    touched_paths = [p for operation in operations if operation.get('op') != 'read' for p in batch_operation_paths(operation)]
+    suppression = event_handler.suppress(touched_paths)
+    
+    results = [None] * len(operations)
+    changes = []
+    try:
+        for wave in plan_batch_waves(operations):
+            for index, (result, change) in zip(wave, batch_executor.map(run_batch_operation, [operations[i] for i in wave])):
+                results[index] = result
+                if change is not None:
+                    changes.append(change)
+    finally:
+        # 监控器的事件可能稍晚到达，解除屏蔽前保留一个节流周期
+        event_handler.release(suppression, event_handler.throttle_delay)
+    
+    if changes:
+        socketio.emit('file_change', {
+            'type': 'batch',
+            'path': '',
+            'changes': changes,
+            'timestamp': time.time()
+        })
+    return jsonify({'results': results})
 
 @app.route('/api/files/<path:file_path>', methods=['GET'])
 def get_file_content(file_path):
@@ -266,6 +563,7 @@ def save_file_content(file_path):
         os.makedirs(os.path.dirname(full_path), exist_ok=True)
         with open(full_path, 'w', encoding='utf-8') as f:
             f.write(content)
+        snapshot_store.mark_dirty(full_path)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -288,6 +586,7 @@ def delete_file(file_path):
         else:
             # 删除文件
             os.remove(full_path)
+        snapshot_store.mark_dirty(full_path)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -318,6 +617,7 @@ def create_file():
             os.makedirs(os.path.dirname(full_path), exist_ok=True)
             with open(full_path, 'w', encoding='utf-8') as f:
                 f.write(content)
+        snapshot_store.mark_dirty(full_path)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -347,14 +647,58 @@ def rename_file(file_path):
     try:
         # 使用os.rename重命名文件或目录
         os.rename(old_full_path, new_full_path)
+        snapshot_store.mark_dirty(old_full_path)
+        snapshot_store.mark_dirty(new_full_path)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/agent/metrics', methods=['GET'])
+def get_agent_metrics():
+    """
+    获取 agent 线程池的负载情况（运行中、排队中、拒绝数等）
+    """
+    return jsonify(agent_namespace.sessions.metrics())
+
+@app.route('/api/snapshots', methods=['GET'])
+def list_snapshots():
+    """
+    获取工作区快照列表
+    参数：
+        thread_id: 可选，只返回该 agent 会话的快照
+    """
+    return jsonify({'snapshots': snapshot_store.checkpoints(request.args.get('thread_id') or None)})
+
+@app.route('/api/snapshots/<checkpoint_id>/restore', methods=['POST'])
+def restore_snapshot(checkpoint_id):
+    """
+    将该 checkpoint 所属会话修改过的文件回滚到快照时的状态
+    参数：
+        thread_id: 可选，要求 checkpoint 属于该会话
+    如果其他会话之后修改过同一批文件，拒绝回滚并返回 409
+    """
+    try:
+        restored = snapshot_store.restore(checkpoint_id, request.args.get('thread_id') or None)
+        return jsonify({'success': True, 'restored': restored})
+    except KeyError:
+        return jsonify({'error': '快照不存在'}), 404
+    except SnapshotConflictError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
+    # 日志级别通过 LOG_LEVEL 环境变量配置，例如 LOG_LEVEL=DEBUG
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
     # 启动文件监控器
     observer.schedule(event_handler, CODESPACE_DIR, recursive=True)
     observer.start()
+    # 文件监控器和工具会上报变化的路径，快照不再需要扫描整个目录
+    snapshot_store.tracking = True
+    symbol_index.tracking = True
     print(f"开始监控目录: {CODESPACE_DIR}")
     
     try:
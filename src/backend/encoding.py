@@ -0,0 +1,143 @@
+from flask import Response, jsonify, request
+import gzip
+
+# 可选依赖：MessagePack 编码和 zstd 压缩，未安装时自动退化为 JSON 和 gzip
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+# 值得压缩的响应类型
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    MSGPACK_MIMETYPE,
+    'text/plain',
+    'text/html',
+    'text/css',
+}
+
+TREE_FORMATS = ('json', 'columnar', 'msgpack')
+
+
+def negotiate_tree_format():
+    """
+    根据 format 参数或 Accept 请求头选择文件列表的编码格式
+    """
+    tree_format = request.args.get('format')
+    if tree_format:
+        return tree_format
+    if MSGPACK_MIMETYPE in request.headers.get('Accept', ''):
+        return 'msgpack'
+    return 'json'
+
+
+def to_columnar(files, base_path=''):
+    """
+    将文件列表转换为列式结构，避免每个节点重复 name/type/path/children 等键
+    path 可由 base_path 和 name 拼接得到，因此不再返回
+    """
+    return {
+        'format': 'columnar',
+        'path': base_path,
+        'columns': {
+            'name': [f['name'] for f in files],
+            'type': [f['type'] for f in files],
+            'size': [f.get('size') for f in files],
+            'modified': [f.get('modified') for f in files],
+        },
+    }
+
+
+def tree_response(files, base_path='', tree_format='json', **extra):
+    """
+    按指定格式返回文件列表响应
+    """
+    if tree_format == 'json':
+        return jsonify({'files': files, **extra})
+    if tree_format not in TREE_FORMATS:
+        return jsonify({'error': f'不支持的格式: {tree_format}'}), 400
+    payload = {**to_columnar(files, base_path), **extra}
+    if tree_format == 'columnar':
+        return jsonify(payload)
+    if msgpack is None:
+        return jsonify({'error': '服务器未安装 msgpack，无法使用 msgpack 格式'}), 406
+    return Response(msgpack.packb(payload, use_bin_type=True), mimetype=MSGPACK_MIMETYPE)
+
+
+def parse_accept_encoding(header):
+    """
+    解析 Accept-Encoding，返回 {编码: q 值}
+    """
+    encodings = {}
+    for item in header.split(','):
+        parts = item.strip().split(';')
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[name] = quality
+    return encodings
+
+
+def choose_encoding(header):
+    """
+    优先选择 zstd（已安装时），其次 gzip，都不接受时返回 None
+    """
+    encodings = parse_accept_encoding(header)
+    wildcard = encodings.get('*', 0.0)
+    candidates = ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+    best = None
+    best_quality = 0.0
+    for name in candidates:
+        quality = encodings.get(name, wildcard)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def init_compression(app, min_size=1024, gzip_level=6, zstd_level=3):
+    """
+    根据 Accept-Encoding 对较大的响应进行 zstd 或 gzip 压缩
+    """
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        if encoding == 'zstd':
+            data = zstandard.ZstdCompressor(level=zstd_level).compress(data)
+        else:
+            data = gzip.compress(data, compresslevel=gzip_level)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Content-Length'] = str(len(data))
+        return response
+
+    return app
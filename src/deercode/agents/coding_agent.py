@@ -6,16 +6,24 @@ from langgraph.checkpoint.memory import InMemorySaver
 from ..tools.bash_tool import bash_tool
 from ..tools.grep_tool import grep_tool
 from ..tools.ls_tool import ls_tool
+from ..tools.symbols_tool import symbols_tool
 from ..tools.tree_tool import tree_tool
-from ..tools.todo_tools import todo_write_tool
+from ..tools.todo_tools import TodoMiddleware, todo_write_tool
+from ..tools.workspace import WorkspaceContext
 from ..prompts.coding_agent import code_sp
+from ..models.http_client import get_model_client_provider
 def init_chat_model():
+    provider = get_model_client_provider()
     return ChatOpenAI(
-        model="ep-20251118111454-bdl9s",
-        base_url="https://ark-cn-beijing.bytedance.net/api/v3",
-        api_key="e77dbd11-8641-4b5e-b9d6-9095a1dc0059",
+        model=os.getenv("DEERCODE_MODEL", "ep-20251118111454-bdl9s"),
+        base_url=os.getenv("DEERCODE_MODEL_BASE_URL", "https://ark-cn-beijing.bytedance.net/api/v3"),
+        api_key=os.getenv("DEERCODE_MODEL_API_KEY", "e77dbd11-8641-4b5e-b9d6-9095a1dc0059"),
         temperature=0,
-        max_tokens=8 * 1024,
+        max_tokens=int(os.getenv("DEERCODE_MODEL_MAX_TOKENS", 8 * 1024)),
+        # 连接池、并发控制和重试都由共享的 HTTP client 负责
+        http_client=provider.client,
+        http_async_client=provider.async_client,
+        max_retries=0,
         extra_body={
             "thinking": {
                 "type": "disabled"  # 如果需要推理，这里可以设置为 "auto"
@@ -33,17 +41,23 @@ def create_coding_agent(plugin_tools: list[BaseTool] = [], **kwargs):
     Returns:
         The coding agent.
     """
+    # 每个会话通过 context=WorkspaceContext(...) 传入自己的工作目录
+    kwargs.setdefault("context_schema", WorkspaceContext)
+    # TODO 列表保存在 graph state 中，列表变化后由中间件在下一次调用模型前追加一次渲染结果
+    middleware = [TodoMiddleware(), *kwargs.pop("middleware", [])]
     return create_agent(
         model=init_chat_model(),
         tools=[
             bash_tool,
             grep_tool,
             ls_tool,
+            symbols_tool,
             todo_write_tool,
             tree_tool,
             *plugin_tools, # 为将来的扩展性做准备，我们将在第下一章的 MCP 节中做介绍
         ],
         system_prompt=code_sp,
+        middleware=middleware,
         **kwargs,
     )
     
@@ -0,0 +1,222 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+import os
+import threading
+import time
+from langgraph.checkpoint.memory import InMemorySaver
+from ..tools.workspace import WorkspaceContext
+
+
+class SessionBusyError(RuntimeError):
+    """Raised when a session already has a run in progress."""
+
+
+class AdmissionError(RuntimeError):
+    """Raised when the worker pool and its queue are both full."""
+
+
+class SessionOwnershipError(RuntimeError):
+    """Raised when a caller uses a session that belongs to someone else."""
+
+
+@dataclass
+class AgentSession:
+    """A conversation thread bound to its own workspace."""
+
+    thread_id: str
+    context: WorkspaceContext
+    # Who created the session (e.g. a socket id or user id); only they may use it
+    owner: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    last_active: float = field(default_factory=time.time)
+    running: bool = False
+
+    @property
+    def config(self) -> dict:
+        return {"configurable": {"thread_id": self.thread_id}}
+
+
+class SessionManager:
+    """Serve many agent sessions from one process through a bounded worker pool.
+
+    Every session carries an explicit `WorkspaceContext`, which is passed to the agent
+    as its runtime context, so tools never depend on the process-global working directory.
+    Runs are admitted only while `max_workers + max_queue` slots are free, and each
+    session runs at most one request at a time to keep its checkpoint consistent.
+    Sessions idle for longer than `session_ttl` seconds are dropped together with their
+    checkpointed history.
+    """
+
+    def __init__(
+        self,
+        agent=None,
+        max_workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        session_ttl: Optional[float] = None,
+    ):
+        if agent is None:
+            from .coding_agent import create_coding_agent
+
+            agent = create_coding_agent(checkpointer=InMemorySaver())
+        self.agent = agent
+        self.max_workers = max_workers or int(os.getenv("DEERCODE_AGENT_WORKERS", 8))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("DEERCODE_AGENT_QUEUE", 32))
+        self.session_ttl = session_ttl if session_ttl is not None else float(os.getenv("DEERCODE_SESSION_TTL", 3600))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="deercode-agent")
+        self._lock = threading.Lock()
+        self._sessions: dict[str, AgentSession] = {}
+        self._running = 0
+        self._queued = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        # Idle sessions are evicted lazily, at most once per interval, when sessions are looked up
+        self.eviction_interval = min(60.0, self.session_ttl)
+        self._last_eviction = time.monotonic()
+
+    def get_or_create_session(
+        self, thread_id: str, root: str, cwd: Optional[str] = None, owner: Optional[str] = None
+    ) -> AgentSession:
+        """Return the session for `thread_id`, creating it with the given workspace if needed.
+
+        An existing session is moved to `cwd` when one is given.
+
+        Raises:
+            ValueError: If `cwd` is outside `root`.
+            SessionOwnershipError: If the session was created by a different `owner`.
+        """
+        self._maybe_evict()
+        context = WorkspaceContext(root=root, cwd=cwd)
+        with self._lock:
+            session = self._sessions.get(thread_id)
+            if session is None:
+                session = AgentSession(thread_id=thread_id, context=context, owner=owner)
+                self._sessions[thread_id] = session
+            elif session.owner != owner:
+                raise SessionOwnershipError(f"Session {thread_id} belongs to another client")
+            elif cwd is not None:
+                # A run already in progress keeps the context it started with
+                session.context = context
+            session.last_active = time.time()
+            return session
+
+    def get_session(self, thread_id: str) -> Optional[AgentSession]:
+        with self._lock:
+            return self._sessions.get(thread_id)
+
+    def close_session(self, thread_id: str):
+        with self._lock:
+            self._sessions.pop(thread_id, None)
+        self._forget_thread(thread_id)
+
+    def close_owner_sessions(self, owner: str) -> int:
+        """Close the idle sessions of `owner`; running ones are left to `evict_idle_sessions`."""
+        with self._lock:
+            thread_ids = [
+                thread_id for thread_id, session in self._sessions.items()
+                if session.owner == owner and not session.running
+            ]
+        for thread_id in thread_ids:
+            self.close_session(thread_id)
+        return len(thread_ids)
+
+    def _forget_thread(self, thread_id: str):
+        # Release the conversation history held by the checkpointer as well
+        checkpointer = getattr(self.agent, "checkpointer", None)
+        if checkpointer is not None and hasattr(checkpointer, "delete_thread"):
+            checkpointer.delete_thread(thread_id)
+
+    def submit(self, thread_id: str, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """Run `func(session, *args, **kwargs)` on the worker pool.
+
+        Raises:
+            KeyError: If the session does not exist.
+            SessionBusyError: If the session already has a run in progress.
+            AdmissionError: If the pool and its queue are full.
+        """
+        with self._lock:
+            session = self._sessions[thread_id]
+            if session.running:
+                self._rejected += 1
+                raise SessionBusyError(f"Session {thread_id} already has a run in progress")
+            if self._running + self._queued >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise AdmissionError(
+                    f"Agent worker pool is full ({self._running} running, {self._queued} queued)"
+                )
+            session.running = True
+            session.last_active = time.time()
+            self._queued += 1
+        return self._executor.submit(self._execute, session, func, args, kwargs)
+
+    def invoke(self, thread_id: str, message: str) -> Future:
+        """Send a user message to the session's agent and return a future of the final state."""
+        return self.submit(
+            thread_id,
+            lambda session: self.agent.invoke(
+                {"messages": [{"role": "user", "content": message}]},
+                config=session.config,
+                context=session.context,
+            ),
+        )
+
+    def _execute(self, session: AgentSession, func, args, kwargs):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            result = func(session, *args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self._failed += 1
+            raise
+        else:
+            with self._lock:
+                self._completed += 1
+            return result
+        finally:
+            with self._lock:
+                self._running -= 1
+                session.running = False
+                session.last_active = time.time()
+
+    def _maybe_evict(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_eviction < self.eviction_interval:
+                return
+            self._last_eviction = now
+        self.evict_idle_sessions()
+
+    def evict_idle_sessions(self) -> int:
+        """Drop sessions that have been idle for longer than `session_ttl` seconds."""
+        deadline = time.time() - self.session_ttl
+        with self._lock:
+            idle = [
+                thread_id
+                for thread_id, session in self._sessions.items()
+                if not session.running and session.last_active < deadline
+            ]
+            for thread_id in idle:
+                del self._sessions[thread_id]
+        for thread_id in idle:
+            self._forget_thread(thread_id)
+        return len(idle)
+
+    def metrics(self) -> dict:
+        """Return a snapshot of the pool's load, for health checks and dashboards."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "running": self._running,
+                "queued": self._queued,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,475 @@
+import asyncio
+import collections
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+from pydantic import BaseModel, Field
+
+# Status codes that are worth retrying: rate limits, lock conflicts and transient server errors.
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class ModelClientSettings(BaseModel):
+    """Transport settings shared by every model call in the process."""
+
+    max_connections: int = Field(default=100, ge=1)
+    max_keepalive_connections: int = Field(default=20, ge=0)
+    keepalive_expiry: float = Field(default=60.0, ge=0)
+    http2: bool = True
+    connect_timeout: float = Field(default=10.0, gt=0)
+    read_timeout: float = Field(default=120.0, gt=0)
+    max_concurrency: int = Field(default=16, ge=1)
+    max_queue_size: int = Field(default=256, ge=0)
+    queue_timeout: float = Field(default=60.0, ge=0)
+    max_retries: int = Field(default=3, ge=0)
+    backoff_base: float = Field(default=0.5, ge=0)
+    backoff_max: float = Field(default=30.0, ge=0)
+
+    @classmethod
+    def from_env(cls) -> "ModelClientSettings":
+        """Build the settings from `DEERCODE_HTTP_*` and `DEERCODE_MODEL_*` environment variables."""
+        return cls(
+            max_connections=_env_int("DEERCODE_HTTP_MAX_CONNECTIONS", 100),
+            max_keepalive_connections=_env_int("DEERCODE_HTTP_MAX_KEEPALIVE", 20),
+            keepalive_expiry=_env_float("DEERCODE_HTTP_KEEPALIVE_EXPIRY", 60.0),
+            http2=_env_bool("DEERCODE_HTTP2", True),
+            connect_timeout=_env_float("DEERCODE_HTTP_CONNECT_TIMEOUT", 10.0),
+            read_timeout=_env_float("DEERCODE_HTTP_READ_TIMEOUT", 120.0),
+            max_concurrency=_env_int("DEERCODE_MODEL_MAX_CONCURRENCY", 16),
+            max_queue_size=_env_int("DEERCODE_MODEL_MAX_QUEUE", 256),
+            queue_timeout=_env_float("DEERCODE_MODEL_QUEUE_TIMEOUT", 60.0),
+            max_retries=_env_int("DEERCODE_MODEL_MAX_RETRIES", 3),
+            backoff_base=_env_float("DEERCODE_MODEL_BACKOFF_BASE", 0.5),
+            backoff_max=_env_float("DEERCODE_MODEL_BACKOFF_MAX", 30.0),
+        )
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse a duration such as `1s`, `6m0s` or `20ms` into seconds."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Return the delay in seconds requested by the server's rate-limit headers, if any."""
+    headers = response.headers
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if "retry-after" in headers:
+        value = headers["retry-after"]
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    resets = []
+    for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        if name in headers:
+            delay = _parse_duration(headers[name])
+            if delay is not None:
+                resets.append(delay)
+    return max(resets) if resets else None
+
+
+class _Waiter:
+    """A caller queued for a concurrency slot, woken by `ConcurrencyLimiter.release`."""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self) -> bool:
+        """Hand the slot to this waiter; return False if it can no longer receive it."""
+        if self.loop is None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(self._resolve)
+        except RuntimeError:
+            # The waiter's event loop has been closed
+            return False
+        return True
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ConcurrencyLimiter:
+    """A process-wide semaphore with a bounded FIFO wait queue.
+
+    Sync and async callers share the same budget and the same queue, so a thread running
+    `invoke` and an event loop running `ainvoke` cannot together exceed `max_concurrency`
+    in-flight calls. A released slot is handed directly to the oldest waiter, and new
+    callers never overtake the queue, so no waiter starves under sustained load.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue_size: int, queue_timeout: float):
+        self._lock = threading.Lock()
+        self._available = max_concurrency
+        self._waiters: collections.deque[_Waiter] = collections.deque()
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.queue_timeout = queue_timeout
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _try_acquire_or_enqueue(self, request: httpx.Request, waiter: _Waiter) -> bool:
+        """Take a free slot if nobody is queued, otherwise queue `waiter`; return whether a slot was taken."""
+        with self._lock:
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                return True
+            if len(self._waiters) >= self.max_queue_size:
+                raise httpx.PoolTimeout(
+                    f"Model request queue is full ({self.max_queue_size} waiting)", request=request
+                )
+            self._waiters.append(waiter)
+            return False
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Remove a waiter that stopped waiting; return True if it was granted a slot meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def _timeout_error(self, request: httpx.Request) -> httpx.PoolTimeout:
+        return httpx.PoolTimeout(
+            f"Timed out after {self.queue_timeout}s waiting for a model request slot", request=request
+        )
+
+    def acquire(self, request: httpx.Request):
+        waiter = _Waiter()
+        if self._try_acquire_or_enqueue(request, waiter):
+            return
+        if waiter.event.wait(self.queue_timeout) or self._abandon(waiter):
+            return
+        raise self._timeout_error(request)
+
+    async def aacquire(self, request: httpx.Request):
+        waiter = _Waiter(asyncio.get_running_loop())
+        if self._try_acquire_or_enqueue(request, waiter):
+            return
+        try:
+            # Wait on the event loop itself, so waiters never occupy executor threads
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                return
+            raise self._timeout_error(request)
+        except BaseException:
+            # Cancelled: pass on a slot that was granted while the task was being cancelled
+            if self._abandon(waiter):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                if waiter.wake():
+                    return
+                waiter.granted = False
+            if self._available >= self.max_concurrency:
+                raise ValueError("ConcurrencyLimiter released too many times")
+            self._available += 1
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Hold the concurrency slot until the (possibly streamed) response body is closed."""
+
+    def __init__(self, stream: httpx.SyncByteStream, release):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    """Async counterpart of `_ReleasingStream`."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+def _backoff_delay(settings: ModelClientSettings, attempt: int, response: Optional[httpx.Response]) -> Optional[float]:
+    """Compute the delay before the next attempt using full jitter, honouring rate-limit headers.
+
+    Returns None when the server asks to wait longer than `backoff_max`: retrying earlier
+    would only waste an attempt, so the response is returned to the caller instead.
+    """
+    if response is not None:
+        retry_after = _retry_after(response)
+        if retry_after is not None:
+            if retry_after > settings.backoff_max:
+                return None
+            # Spread the retries of callers that were told the same reset time
+            return retry_after + random.uniform(0, settings.backoff_base)
+    return random.uniform(0, min(settings.backoff_max, settings.backoff_base * (2 ** attempt)))
+
+
+class RetryingTransport(httpx.BaseTransport):
+    """A pooled transport that limits concurrency and retries transient failures."""
+
+    def __init__(self, settings: ModelClientSettings, limiter: ConcurrencyLimiter):
+        self._settings = settings
+        self._limiter = limiter
+        self._transport = httpx.HTTPTransport(
+            http2=settings.http2,
+            limits=httpx.Limits(
+                max_connections=settings.max_connections,
+                max_keepalive_connections=settings.max_keepalive_connections,
+                keepalive_expiry=settings.keepalive_expiry,
+            ),
+        )
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            self._limiter.acquire(request)
+            try:
+                response = self._transport.handle_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError):
+                self._limiter.release()
+                if attempt >= self._settings.max_retries:
+                    raise
+                time.sleep(_backoff_delay(self._settings, attempt, None))
+                attempt += 1
+                continue
+            except BaseException:
+                self._limiter.release()
+                raise
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self._settings.max_retries:
+                delay = _backoff_delay(self._settings, attempt, response)
+                if delay is not None:
+                    response.close()
+                    self._limiter.release()
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+
+            return httpx.Response(
+                response.status_code,
+                headers=response.headers,
+                stream=_ReleasingStream(response.stream, self._limiter.release),
+                extensions=response.extensions,
+            )
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncRetryingTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of `RetryingTransport`.
+
+    An async connection pool is bound to the event loop it first runs on, so one pool is
+    kept per event loop. This lets the single `AsyncClient` handed to the chat models be
+    used from several loops, e.g. one per worker thread.
+    """
+
+    def __init__(self, settings: ModelClientSettings, limiter: ConcurrencyLimiter):
+        self._settings = settings
+        self._limiter = limiter
+        self._lock = threading.Lock()
+        # event loop -> the connection pool used on that loop
+        self._transports = weakref.WeakKeyDictionary()
+
+    def _loop_transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = httpx.AsyncHTTPTransport(
+                    http2=self._settings.http2,
+                    limits=httpx.Limits(
+                        max_connections=self._settings.max_connections,
+                        max_keepalive_connections=self._settings.max_keepalive_connections,
+                        keepalive_expiry=self._settings.keepalive_expiry,
+                    ),
+                )
+                self._transports[loop] = transport
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        transport = self._loop_transport()
+        attempt = 0
+        while True:
+            await self._limiter.aacquire(request)
+            try:
+                response = await transport.handle_async_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError):
+                self._limiter.release()
+                if attempt >= self._settings.max_retries:
+                    raise
+                await asyncio.sleep(_backoff_delay(self._settings, attempt, None))
+                attempt += 1
+                continue
+            except BaseException:
+                self._limiter.release()
+                raise
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self._settings.max_retries:
+                delay = _backoff_delay(self._settings, attempt, response)
+                if delay is not None:
+                    await response.aclose()
+                    self._limiter.release()
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+
+            return httpx.Response(
+                response.status_code,
+                headers=response.headers,
+                stream=_AsyncReleasingStream(response.stream, self._limiter.release),
+                extensions=response.extensions,
+            )
+
+    async def aclose(self):
+        # Only the pool of the running loop can be closed from here; the others are
+        # released when their loops are garbage collected.
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.pop(loop, None)
+        if transport is not None:
+            await transport.aclose()
+
+
+class ModelClientProvider:
+    """Process-wide provider of pooled HTTP clients for model calls.
+
+    Every chat model created through this provider shares the same connection pools,
+    concurrency limiter and retry policy instead of opening its own connections. The sync
+    client has one pool for the process; the async client keeps one pool per event loop.
+    """
+
+    def __init__(self, settings: Optional[ModelClientSettings] = None):
+        self.settings = settings or ModelClientSettings.from_env()
+        if self.settings.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                # HTTP/2 needs the optional `h2` package (`httpx[http2]`); fall back to HTTP/1.1 keep-alive
+                self.settings = self.settings.model_copy(update={"http2": False})
+        self.limiter = ConcurrencyLimiter(
+            self.settings.max_concurrency,
+            self.settings.max_queue_size,
+            self.settings.queue_timeout,
+        )
+        self._lock = threading.Lock()
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.settings.read_timeout, connect=self.settings.connect_timeout)
+
+    @property
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(
+                    transport=RetryingTransport(self.settings, self.limiter),
+                    timeout=self._timeout(),
+                )
+            return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = httpx.AsyncClient(
+                    transport=AsyncRetryingTransport(self.settings, self.limiter),
+                    timeout=self._timeout(),
+                )
+            return self._async_client
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+            # The async pools are bound to the loops that used them; let them be garbage collected
+            self._async_client = None
+
+
+_provider: Optional[ModelClientProvider] = None
+_provider_lock = threading.Lock()
+
+
+def get_model_client_provider() -> ModelClientProvider:
+    """Return the process-wide `ModelClientProvider`, creating it on first use."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = ModelClientProvider()
+        return _provider
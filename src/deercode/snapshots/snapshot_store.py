@@ -0,0 +1,544 @@
+from contextlib import contextmanager, nullcontext
+from typing import Iterable, Optional
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from langchain.tools import ToolRuntime
+from ..tools.workspace import resolve_root, workspace_state_dir
+
+# Name prefix of the files written to find out when the watcher has caught up
+SYNC_FILE_PREFIX = ".deercode-sync-"
+
+# Watcher events for paths reported explicitly within this many seconds are not attributed again
+EXPLICIT_REPORT_WINDOW = 5.0
+
+# Directories that are never snapshotted: VCS metadata, dependencies, caches and the store itself
+IGNORED_DIRS = {".git", ".deercode", "node_modules", "__pycache__", ".venv", "venv", ".mypy_cache", ".pytest_cache"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    checkpoint_id TEXT UNIQUE NOT NULL,
+    thread_id TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER NOT NULL REFERENCES checkpoints(seq) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    digest TEXT,
+    PRIMARY KEY (seq, path)
+);
+CREATE INDEX IF NOT EXISTS changes_path ON changes (path, seq);
+CREATE INDEX IF NOT EXISTS checkpoints_thread ON checkpoints (thread_id, seq);
+"""
+
+
+class SnapshotConflictError(RuntimeError):
+    """Raised when a restore would undo changes made by another thread or of unknown origin."""
+
+
+def _within(path: str, roots: Iterable[str]) -> bool:
+    return any(path == root or path.startswith(root + "/") for root in roots)
+
+
+class SnapshotStore:
+    """Content-addressed snapshots of a workspace, keyed by agent checkpoint id.
+
+    File contents are stored once per distinct SHA-256 digest under `objects/`, and each
+    checkpoint only records the files that changed since the previous one (a `None` digest
+    marks a deletion). Rolling back rewrites only the files touched after the target
+    checkpoint, so both operations cost in proportion to the change rather than the repo.
+
+    Changed files are found either from paths reported with `mark_dirty` (e.g. by a file
+    watcher or the file API) or, when nothing reports them, by comparing `stat` results
+    against the last snapshot and hashing only the files whose size or mtime moved.
+
+    Every reported path carries its owner: the agent thread whose tool wrote it, or `None`
+    when the origin is unknown or is not an agent (e.g. the file API). Tools either report
+    the files they write (`report_tool_write`) or run inside `track_tool_writes`, which
+    attributes watcher events (`report_event`) to the thread while it is the only one
+    writing, and waits for the watcher to catch up before the tool returns. A thread's
+    snapshot records only its own paths; other changes are recorded under separate
+    "external" checkpoints. All threads share one workspace, so a restore only rewrites the
+    files that its own thread changed, and refuses to undo any later change made by another
+    thread or of unknown origin.
+    The store lives outside the workspace (see `workspace_state_dir`).
+    """
+
+    def __init__(self, root: str, store_dir: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.store_dir = store_dir or os.path.join(workspace_state_dir(self.root), "snapshots")
+        self.objects_dir = os.path.join(self.store_dir, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        # owner (thread id, or None for unknown origin) -> reported paths
+        self._dirty: dict[Optional[str], set[str]] = {}
+        # thread id -> number of its tool calls that are currently writing
+        self._writers: dict[str, int] = {}
+        # path -> (owner, time) of its last explicit report, so the watcher's echo is not misattributed
+        self._explicit: dict[str, tuple[Optional[str], float]] = {}
+        # name of a pending sync file -> event set when the watcher reports it
+        self._sync_waiters: dict[str, threading.Event] = {}
+        # How long `wait_for_watcher` waits for the watcher to report its sync file
+        self.sync_timeout = 2.0
+        # Set by whoever reports changes through `mark_dirty`; otherwise every snapshot scans the tree
+        self.tracking = False
+        self._db = sqlite3.connect(os.path.join(self.store_dir, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+
+    def _relpath(self, path: str) -> Optional[str]:
+        full_path = os.path.abspath(os.path.join(self.root, path))
+        relative_path = os.path.relpath(full_path, self.root)
+        if relative_path == "." or relative_path.startswith(".."):
+            return None
+        if set(relative_path.split(os.sep)) & IGNORED_DIRS:
+            return None
+        return relative_path.replace(os.sep, "/")
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def mark_dirty(self, path: str, owner: Optional[str] = None):
+        """Report that a file or directory may have changed.
+
+        Args:
+            path: The path, absolute or relative to the root.
+            owner: The agent thread that wrote it, or `None` if it was not an agent.
+        """
+        relative_path = self._relpath(path)
+        if relative_path is not None:
+            with self._lock:
+                self._dirty.setdefault(owner, set()).add(relative_path)
+                self._explicit[relative_path] = (owner, time.monotonic())
+
+    def report_event(self, path: str):
+        """Report a file watcher event, attributing it to the only thread currently writing, if any.
+
+        An event for a path that was just reported explicitly by someone else, e.g. the echo of
+        a file API edit made while a thread is running a tool, is of unknown origin.
+        """
+        name = os.path.basename(path)
+        if name.startswith(SYNC_FILE_PREFIX):
+            with self._lock:
+                waiter = self._sync_waiters.get(name)
+            if waiter is not None:
+                waiter.set()
+            return
+        relative_path = self._relpath(path)
+        if relative_path is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._explicit) > 1024:
+                self._explicit = {
+                    p: report for p, report in self._explicit.items()
+                    if now - report[1] < EXPLICIT_REPORT_WINDOW
+                }
+            writers = [thread_id for thread_id, count in self._writers.items() if count > 0]
+            owner = writers[0] if len(writers) == 1 else None
+            ancestor = relative_path
+            while ancestor:
+                report = self._explicit.get(ancestor)
+                if report is not None and now - report[1] < EXPLICIT_REPORT_WINDOW:
+                    if report[0] != owner:
+                        owner = None
+                    break
+                ancestor = os.path.dirname(ancestor)
+            self._dirty.setdefault(owner, set()).add(relative_path)
+
+    def wait_for_watcher(self) -> bool:
+        """Write a sync file and wait until the watcher reports it.
+
+        Watchers deliver events in order, so once the sync file is seen, every earlier change
+        has been reported. Returns False if the watcher did not catch up within `sync_timeout`.
+        """
+        if not self.tracking:
+            return True
+        name = f"{SYNC_FILE_PREFIX}{uuid.uuid4().hex}"
+        full_path = os.path.join(self.root, name)
+        waiter = threading.Event()
+        with self._lock:
+            self._sync_waiters[name] = waiter
+        try:
+            with open(full_path, "w"):
+                pass
+            return waiter.wait(self.sync_timeout)
+        finally:
+            with self._lock:
+                self._sync_waiters.pop(name, None)
+            try:
+                os.remove(full_path)
+            except OSError:
+                pass
+
+    @contextmanager
+    def writing(self, thread_id: str):
+        """Attribute the watcher events that arrive while the block runs to `thread_id`.
+
+        On exit, waits for the watcher to catch up so that late events are attributed too.
+        Events that arrive while several threads are writing stay of unknown origin.
+        """
+        with self._lock:
+            self._writers[thread_id] = self._writers.get(thread_id, 0) + 1
+        try:
+            yield
+        finally:
+            try:
+                self.wait_for_watcher()
+            finally:
+                with self._lock:
+                    self._writers[thread_id] -= 1
+                    if not self._writers[thread_id]:
+                        del self._writers[thread_id]
+
+    def _put_blob(self, full_path: str) -> str:
+        """Hash a file and copy it into the object store unless the same content is already there."""
+        hasher = hashlib.sha256()
+        with open(full_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path))
+            os.close(fd)
+            # Blobs are copied, never hard-linked to workspace files: editors and tools rewrite
+            # files in place, which would silently change a shared inode inside the store.
+            shutil.copyfile(full_path, tmp_path)
+            os.replace(tmp_path, blob_path)
+        return digest
+
+    def _walk(self, relative_dir: str = "") -> Iterable[tuple[str, os.stat_result]]:
+        start = os.path.join(self.root, relative_dir)
+        if not os.path.isdir(start):
+            return
+        for dirpath, dirnames, filenames in os.walk(start):
+            dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+            for filename in filenames:
+                if filename.startswith(SYNC_FILE_PREFIX):
+                    continue
+                full_path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(full_path, follow_symlinks=False)
+                except OSError:
+                    continue
+                if os.path.isfile(full_path) and not os.path.islink(full_path):
+                    yield os.path.relpath(full_path, self.root).replace(os.sep, "/"), st
+
+    def _candidates(self, paths: Optional[Iterable[str]]) -> dict[str, Optional[os.stat_result]]:
+        """Return `{path: stat or None}` for every file that may differ from the index."""
+        found: dict[str, Optional[os.stat_result]] = {}
+        if paths is None:
+            for relative_path, st in self._walk():
+                found[relative_path] = st
+            for (relative_path,) in self._db.execute("SELECT path FROM files"):
+                found.setdefault(relative_path, None)
+            return found
+
+        for relative_path in paths:
+            full_path = os.path.join(self.root, relative_path)
+            if os.path.isdir(full_path):
+                for child, st in self._walk(relative_path):
+                    found[child] = st
+            elif os.path.isfile(full_path) and not os.path.islink(full_path):
+                found[relative_path] = os.stat(full_path)
+            else:
+                found.setdefault(relative_path, None)
+            # Indexed files below a deleted or renamed directory
+            prefix = relative_path.rstrip("/") + "/"
+            for (child,) in self._db.execute(
+                "SELECT path FROM files WHERE path = ? OR substr(path, 1, ?) = ?",
+                (relative_path, len(prefix), prefix),
+            ):
+                found.setdefault(child, None)
+        return found
+
+    def _detect_changes(
+        self, paths: Optional[Iterable[str]], exclude: Iterable[str] = ()
+    ) -> dict[str, Optional[str]]:
+        """Diff the candidates against the index and store new blobs; return `{path: digest or None}`.
+
+        Paths under `exclude` are left for whoever claimed them.
+        """
+        exclude = list(exclude)
+        changes: dict[str, Optional[str]] = {}
+        for relative_path, st in self._candidates(paths).items():
+            if exclude and _within(relative_path, exclude):
+                continue
+            row = self._db.execute(
+                "SELECT mtime_ns, size, digest FROM files WHERE path = ?", (relative_path,)
+            ).fetchone()
+            if st is None:
+                if row is not None:
+                    changes[relative_path] = None
+                continue
+            if row is not None and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+                continue
+            try:
+                digest = self._put_blob(os.path.join(self.root, relative_path))
+            except OSError:
+                # The file vanished or became unreadable while we were looking at it
+                continue
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (path, mtime_ns, size, digest) VALUES (?, ?, ?, ?)",
+                (relative_path, st.st_mtime_ns, st.st_size, digest),
+            )
+            if row is None or row[2] != digest:
+                changes[relative_path] = digest
+        for relative_path, digest in changes.items():
+            if digest is None:
+                self._db.execute("DELETE FROM files WHERE path = ?", (relative_path,))
+        return changes
+
+    def _differs(self, relative_path: str) -> bool:
+        """Return whether a file's size or mtime no longer matches the index."""
+        row = self._db.execute("SELECT mtime_ns, size FROM files WHERE path = ?", (relative_path,)).fetchone()
+        full_path = os.path.join(self.root, relative_path)
+        if not os.path.isfile(full_path) or os.path.islink(full_path):
+            return row is not None
+        st = os.stat(full_path)
+        return row is None or row[0] != st.st_mtime_ns or row[1] != st.st_size
+
+    def _record(self, checkpoint_id: str, thread_id: Optional[str], changes: dict[str, Optional[str]]):
+        seq = self._db.execute(
+            "INSERT INTO checkpoints (checkpoint_id, thread_id, created_at) VALUES (?, ?, ?)",
+            (checkpoint_id, thread_id, time.time()),
+        ).lastrowid
+        self._db.executemany(
+            "INSERT INTO changes (seq, path, digest) VALUES (?, ?, ?)",
+            [(seq, path, digest) for path, digest in changes.items()],
+        )
+
+    def snapshot(self, checkpoint_id: str, thread_id: str) -> dict[str, Optional[str]]:
+        """Record the files that `thread_id` changed since its previous snapshot under `checkpoint_id`.
+
+        The first snapshot of a workspace records every file and becomes the baseline. Changes
+        of unknown origin reported so far are recorded under a separate external checkpoint.
+        With `tracking` set, only reported paths are looked at, so the cost follows the size
+        of the change; without it, the whole tree is compared by size and mtime.
+
+        Returns:
+            The changes recorded for the thread as `{path: digest}`, with `None` for deleted files.
+        """
+        with self._lock, self._db:
+            existing = self._db.execute(
+                "SELECT 1 FROM checkpoints WHERE checkpoint_id = ?", (checkpoint_id,)
+            ).fetchone()
+            if existing:
+                return {}
+
+            if self._db.execute("SELECT 1 FROM checkpoints LIMIT 1").fetchone() is None:
+                self._dirty.clear()
+                changes = self._detect_changes(None)
+                self._record(checkpoint_id, thread_id, changes)
+                return changes
+
+            owned = sorted(self._dirty.pop(thread_id, set()))
+            unknown = self._dirty.pop(None, set())
+            # Paths reported by other threads stay theirs until they take their own snapshot
+            claimed = set().union(*self._dirty.values())
+            if self.tracking:
+                changes = self._detect_changes(owned)
+                external = self._detect_changes(sorted(unknown), exclude=claimed)
+            else:
+                detected = self._detect_changes(None, exclude=claimed)
+                changes = {path: digest for path, digest in detected.items() if _within(path, owned)}
+                external = {path: digest for path, digest in detected.items() if path not in changes}
+
+            self._record(checkpoint_id, thread_id, changes)
+            if external:
+                self._record(f"external-{uuid.uuid4().hex}", None, external)
+            return changes
+
+    def restore(self, checkpoint_id: str, thread_id: Optional[str] = None) -> list[str]:
+        """Roll the files of a thread back to the state recorded at `checkpoint_id`.
+
+        Only files changed by the checkpoint's thread after the checkpoint are rewritten,
+        including edits to those files that the thread made but did not snapshot yet. Later
+        checkpoints of the same thread are discarded; other threads keep theirs.
+
+        Args:
+            checkpoint_id: The checkpoint to roll back to.
+            thread_id: If given, the checkpoint must belong to this thread.
+
+        Returns:
+            The relative paths that were restored or removed.
+
+        Raises:
+            KeyError: If no snapshot exists for `checkpoint_id` (in `thread_id`).
+            SnapshotConflictError: If one of the files was changed after the checkpoint by
+                another thread or by an edit of unknown origin.
+        """
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT seq, thread_id FROM checkpoints WHERE checkpoint_id = ?", (checkpoint_id,)
+            ).fetchone()
+            if row is None or row[1] is None or (thread_id is not None and row[1] != thread_id):
+                raise KeyError(f"No snapshot for checkpoint {checkpoint_id}")
+            target_seq, owner = row
+
+            touched = {
+                path for (path,) in self._db.execute(
+                    "SELECT DISTINCT ch.path FROM changes ch JOIN checkpoints c ON c.seq = ch.seq "
+                    "WHERE ch.seq > ? AND c.thread_id IS ?",
+                    (target_seq, owner),
+                )
+            }
+            # Recorded by other threads or as external changes
+            conflicts = touched.intersection(
+                path for (path,) in self._db.execute(
+                    "SELECT DISTINCT ch.path FROM changes ch JOIN checkpoints c ON c.seq = ch.seq "
+                    "WHERE ch.seq > ? AND c.thread_id IS NOT ?",
+                    (target_seq, owner),
+                )
+            )
+            # Not recorded yet, and not reported by this thread either
+            owned = self._dirty.get(owner, set())
+            conflicts.update(
+                path for path in touched if not _within(path, owned) and self._differs(path)
+            )
+            if conflicts:
+                conflicts = sorted(conflicts)
+                raise SnapshotConflictError(
+                    f"Files changed later by another thread or client: {', '.join(conflicts[:10])}"
+                    + (f" and {len(conflicts) - 10} more" if len(conflicts) > 10 else "")
+                )
+
+            # Pick up this thread's unsnapshotted edits to these files so they are rolled back too
+            self._detect_changes(sorted(touched))
+
+            restored = []
+            for relative_path in sorted(touched):
+                target = self._db.execute(
+                    "SELECT digest FROM changes WHERE path = ? AND seq <= ? ORDER BY seq DESC LIMIT 1",
+                    (relative_path, target_seq),
+                ).fetchone()
+                digest = target[0] if target else None
+                current = self._db.execute("SELECT digest FROM files WHERE path = ?", (relative_path,)).fetchone()
+                if (current[0] if current else None) == digest:
+                    continue
+                self._materialize(relative_path, digest)
+                restored.append(relative_path)
+
+            self._db.execute("DELETE FROM checkpoints WHERE seq > ? AND thread_id IS ?", (target_seq, owner))
+            return restored
+
+    def _materialize(self, relative_path: str, digest: Optional[str]):
+        full_path = os.path.join(self.root, relative_path)
+        if digest is None:
+            if os.path.isfile(full_path):
+                os.remove(full_path)
+            self._db.execute("DELETE FROM files WHERE path = ?", (relative_path,))
+            self._explicit[relative_path] = (None, time.monotonic())
+            return
+        parent = os.path.dirname(full_path)
+        if os.path.isfile(parent):
+            os.remove(parent)
+        os.makedirs(parent, exist_ok=True)
+        if os.path.isdir(full_path):
+            shutil.rmtree(full_path)
+        fd, tmp_path = tempfile.mkstemp(dir=parent, prefix=".deercode-restore-")
+        os.close(fd)
+        shutil.copyfile(self._blob_path(digest), tmp_path)
+        os.replace(tmp_path, full_path)
+        st = os.stat(full_path)
+        self._db.execute(
+            "INSERT OR REPLACE INTO files (path, mtime_ns, size, digest) VALUES (?, ?, ?, ?)",
+            (relative_path, st.st_mtime_ns, st.st_size, digest),
+        )
+        self._explicit[relative_path] = (None, time.monotonic())
+
+    def checkpoints(self, thread_id: Optional[str] = None) -> list[dict]:
+        """List the checkpoints of agent threads, oldest first, with the number of files each one changed.
+
+        Args:
+            thread_id: If given, only list the checkpoints of this thread.
+        """
+        query = (
+            "SELECT c.checkpoint_id, c.thread_id, c.created_at, COUNT(ch.path) FROM checkpoints c "
+            "LEFT JOIN changes ch ON ch.seq = c.seq {where} GROUP BY c.seq ORDER BY c.seq"
+        )
+        with self._lock:
+            if thread_id is None:
+                rows = self._db.execute(query.format(where="WHERE c.thread_id IS NOT NULL")).fetchall()
+            else:
+                rows = self._db.execute(query.format(where="WHERE c.thread_id = ?"), (thread_id,)).fetchall()
+        return [
+            {"checkpoint_id": cid, "thread_id": tid, "created_at": created_at, "changes": count}
+            for cid, tid, created_at, count in rows
+        ]
+
+    def gc(self) -> int:
+        """Delete blobs that no checkpoint references any more; return how many were removed."""
+        with self._lock:
+            referenced = {
+                digest for (digest,) in self._db.execute("SELECT DISTINCT digest FROM changes WHERE digest IS NOT NULL")
+            }
+            referenced.update(digest for (digest,) in self._db.execute("SELECT digest FROM files"))
+            removed = 0
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                for name in os.listdir(prefix_dir):
+                    if prefix + name not in referenced:
+                        os.remove(os.path.join(prefix_dir, name))
+                        removed += 1
+            return removed
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_stores: dict[str, SnapshotStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_snapshot_store(root: str) -> SnapshotStore:
+    """Return the shared `SnapshotStore` for a workspace root, opening it on first use."""
+    root = os.path.abspath(root)
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = SnapshotStore(root)
+        return _stores[root]
+
+
+def _tool_target(runtime: Optional[ToolRuntime]) -> tuple[Optional[SnapshotStore], Optional[str]]:
+    with _stores_lock:
+        store = _stores.get(resolve_root(runtime))
+    thread_id = ((getattr(runtime, "config", None) or {}).get("configurable") or {}).get("thread_id")
+    return store, thread_id
+
+
+def report_tool_write(runtime: Optional[ToolRuntime], path: str):
+    """Attribute a file written by a tool to the agent thread that ran it.
+
+    Does nothing when the workspace has no open snapshot store, e.g. under `langgraph dev`.
+    """
+    store, thread_id = _tool_target(runtime)
+    if store is not None and thread_id is not None:
+        store.mark_dirty(path, owner=thread_id)
+
+
+def track_tool_writes(runtime: Optional[ToolRuntime]):
+    """Return a context manager that attributes the files a tool writes to its agent thread.
+
+    For tools that cannot tell which files they change, such as shell commands.
+    """
+    store, thread_id = _tool_target(runtime)
+    if store is None or thread_id is None:
+        return nullcontext()
+    return store.writing(thread_id)
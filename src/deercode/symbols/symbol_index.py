@@ -0,0 +1,335 @@
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+import ast
+import os
+import re
+import sqlite3
+import threading
+from ..tools.workspace import workspace_state_dir
+
+# Directories that never contain source worth indexing
+IGNORED_DIRS = {
+    ".git", ".deercode", "node_modules", "__pycache__", ".venv", "venv",
+    ".mypy_cache", ".pytest_cache", "dist", "build", "target",
+}
+
+# Files larger than this are most likely generated or bundled and are skipped
+MAX_FILE_SIZE = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS definitions (
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    qualname TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    end_line INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    line INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS definitions_name ON definitions (name);
+CREATE INDEX IF NOT EXISTS definitions_path ON definitions (path);
+CREATE INDEX IF NOT EXISTS refs_name ON refs (name);
+CREATE INDEX IF NOT EXISTS refs_path ON refs (path);
+"""
+
+
+@dataclass
+class Definition:
+    """A symbol defined in a source file."""
+
+    name: str
+    qualname: str
+    kind: str
+    line: int
+    end_line: int
+
+
+@dataclass
+class Reference:
+    """A use of a name in a source file."""
+
+    name: str
+    line: int
+
+
+# An extractor parses one file and returns the symbols it defines and the names it uses
+Extractor = Callable[[str], tuple[list[Definition], list[Reference]]]
+
+_extractors: dict[str, Extractor] = {}
+
+
+def register_extractor(extensions: Iterable[str], extractor: Extractor):
+    """Register an extractor for files with the given extensions (e.g. `[".py"]`)."""
+    for extension in extensions:
+        _extractors[extension.lower()] = extractor
+
+
+def extract_python(source: str) -> tuple[list[Definition], list[Reference]]:
+    """Extract classes, functions, methods and module-level variables with `ast`."""
+    definitions: list[Definition] = []
+    references: list[Reference] = []
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return definitions, references
+
+    def visit(node: ast.AST, scope: list[str], in_class: bool):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                if isinstance(child, ast.ClassDef):
+                    kind = "class"
+                else:
+                    kind = "method" if in_class else "function"
+                definitions.append(Definition(
+                    name=child.name,
+                    qualname=".".join(scope + [child.name]),
+                    kind=kind,
+                    line=child.lineno,
+                    end_line=getattr(child, "end_lineno", None) or child.lineno,
+                ))
+                visit(child, scope + [child.name], isinstance(child, ast.ClassDef))
+                continue
+            if not scope and isinstance(child, (ast.Assign, ast.AnnAssign)):
+                targets = child.targets if isinstance(child, ast.Assign) else [child.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        definitions.append(Definition(
+                            name=target.id,
+                            qualname=target.id,
+                            kind="variable",
+                            line=child.lineno,
+                            end_line=getattr(child, "end_lineno", None) or child.lineno,
+                        ))
+            if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Load):
+                references.append(Reference(name=child.id, line=child.lineno))
+            elif isinstance(child, ast.Attribute):
+                references.append(Reference(name=child.attr, line=child.lineno))
+            elif isinstance(child, ast.alias):
+                references.append(Reference(name=child.name.split(".")[-1], line=getattr(child, "lineno", 0) or 0))
+            visit(child, scope, in_class)
+
+    visit(tree, [], False)
+    return definitions, references
+
+
+_JS_DEFINITION_PATTERNS = [
+    (re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)"), "function"),
+    (re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)"), "class"),
+    (re.compile(r"^\s*(?:export\s+)?interface\s+([A-Za-z_$][\w$]*)"), "interface"),
+    (re.compile(r"^\s*(?:export\s+)?type\s+([A-Za-z_$][\w$]*)\s*(?:<[^=]*>)?\s*="), "type"),
+    (re.compile(r"^\s*(?:export\s+)?(?:const\s+)?enum\s+([A-Za-z_$][\w$]*)"), "enum"),
+    (re.compile(r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*(?:async\s+)?(?:\([^)]*\)|[A-Za-z_$][\w$]*)\s*(?::[^=]+)?=>"), "function"),
+    (re.compile(r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)"), "variable"),
+]
+_JS_IDENTIFIER = re.compile(r"[A-Za-z_$][\w$]*")
+_JS_KEYWORDS = {
+    "as", "async", "await", "break", "case", "catch", "class", "const", "continue", "default", "delete",
+    "do", "else", "enum", "export", "extends", "false", "finally", "for", "from", "function", "if",
+    "implements", "import", "in", "instanceof", "interface", "let", "new", "null", "of", "return",
+    "static", "super", "switch", "this", "throw", "true", "try", "type", "typeof", "undefined", "var",
+    "void", "while", "yield",
+}
+_JS_COMMENT_OR_STRING = re.compile(r"//.*$|'(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\"|`(?:\\.|[^`\\])*`")
+
+
+def extract_javascript(source: str) -> tuple[list[Definition], list[Reference]]:
+    """Regex-based fallback for JS/TS: top-level declarations and identifier uses, line by line."""
+    definitions: list[Definition] = []
+    references: list[Reference] = []
+    for line_number, line in enumerate(source.splitlines(), start=1):
+        for pattern, kind in _JS_DEFINITION_PATTERNS:
+            match = pattern.match(line)
+            if match:
+                name = match.group(1)
+                definitions.append(Definition(name=name, qualname=name, kind=kind, line=line_number, end_line=line_number))
+                break
+        code = _JS_COMMENT_OR_STRING.sub(" ", line)
+        for name in set(_JS_IDENTIFIER.findall(code)):
+            if name not in _JS_KEYWORDS:
+                references.append(Reference(name=name, line=line_number))
+    return definitions, references
+
+
+register_extractor([".py", ".pyi"], extract_python)
+register_extractor([".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx"], extract_javascript)
+
+
+class SymbolIndex:
+    """A persistent, incrementally updated index of definitions and references in a workspace.
+
+    Files are re-parsed only when their size or mtime changes, or when a watcher reports
+    them through `mark_dirty`. The index lives in `symbols.sqlite3` in the workspace's state
+    directory (see `workspace_state_dir`), so it survives restarts and only the files edited
+    in between are parsed again.
+    """
+
+    def __init__(self, root: str, index_path: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        index_path = index_path or os.path.join(workspace_state_dir(self.root), "symbols.sqlite3")
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._dirty: set[str] = set()
+        self._scanned = False
+        # Set by whoever reports changes through `mark_dirty`; otherwise every refresh scans the tree
+        self.tracking = False
+        self._db = sqlite3.connect(index_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def _relpath(self, path: str) -> Optional[str]:
+        relative_path = os.path.relpath(os.path.abspath(os.path.join(self.root, path)), self.root)
+        if relative_path == "." or relative_path.startswith(".."):
+            return None
+        if set(relative_path.split(os.sep)) & IGNORED_DIRS:
+            return None
+        return relative_path.replace(os.sep, "/")
+
+    def mark_dirty(self, path: str):
+        """Report that a file or directory (absolute, or relative to the root) may have changed."""
+        relative_path = self._relpath(path)
+        if relative_path is not None:
+            with self._lock:
+                self._dirty.add(relative_path)
+
+    def _walk(self, relative_dir: str = "") -> Iterable[tuple[str, os.stat_result]]:
+        start = os.path.join(self.root, relative_dir)
+        for dirpath, dirnames, filenames in os.walk(start):
+            dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() not in _extractors:
+                    continue
+                full_path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(full_path)
+                except OSError:
+                    continue
+                yield os.path.relpath(full_path, self.root).replace(os.sep, "/"), st
+
+    def _candidates(self, paths: Optional[list[str]]) -> dict[str, Optional[os.stat_result]]:
+        found: dict[str, Optional[os.stat_result]] = {}
+        if paths is None:
+            found.update(self._walk())
+            for (relative_path,) in self._db.execute("SELECT path FROM files"):
+                found.setdefault(relative_path, None)
+            return found
+        for relative_path in paths:
+            full_path = os.path.join(self.root, relative_path)
+            if os.path.isdir(full_path):
+                found.update(self._walk(relative_path))
+            elif os.path.isfile(full_path) and os.path.splitext(full_path)[1].lower() in _extractors:
+                found[relative_path] = os.stat(full_path)
+            prefix = relative_path.rstrip("/") + "/"
+            for (child,) in self._db.execute(
+                "SELECT path FROM files WHERE path = ? OR substr(path, 1, ?) = ?",
+                (relative_path, len(prefix), prefix),
+            ):
+                found.setdefault(child, None)
+        return found
+
+    def _remove(self, relative_path: str):
+        self._db.execute("DELETE FROM files WHERE path = ?", (relative_path,))
+        self._db.execute("DELETE FROM definitions WHERE path = ?", (relative_path,))
+        self._db.execute("DELETE FROM refs WHERE path = ?", (relative_path,))
+
+    def refresh(self) -> int:
+        """Re-index the files that changed since the last refresh; return how many were parsed."""
+        with self._lock, self._db:
+            if self.tracking and self._scanned:
+                paths = sorted(self._dirty)
+            else:
+                paths = None
+            self._dirty.clear()
+            parsed = 0
+            for relative_path, st in self._candidates(paths).items():
+                row = self._db.execute(
+                    "SELECT mtime_ns, size FROM files WHERE path = ?", (relative_path,)
+                ).fetchone()
+                if st is None:
+                    if row is not None:
+                        self._remove(relative_path)
+                    continue
+                if row is not None and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+                    continue
+                self._remove(relative_path)
+                self._db.execute(
+                    "INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)",
+                    (relative_path, st.st_mtime_ns, st.st_size),
+                )
+                if st.st_size > MAX_FILE_SIZE:
+                    continue
+                try:
+                    with open(os.path.join(self.root, relative_path), "r", encoding="utf-8", errors="replace") as f:
+                        source = f.read()
+                except OSError:
+                    continue
+                extractor = _extractors[os.path.splitext(relative_path)[1].lower()]
+                definitions, references = extractor(source)
+                self._db.executemany(
+                    "INSERT INTO definitions (path, name, qualname, kind, line, end_line) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(relative_path, d.name, d.qualname, d.kind, d.line, d.end_line) for d in definitions],
+                )
+                self._db.executemany(
+                    "INSERT INTO refs (path, name, line) VALUES (?, ?, ?)",
+                    # One row per name and line is enough to point the agent at the right place
+                    list({(relative_path, r.name, r.line) for r in references}),
+                )
+                parsed += 1
+            self._scanned = True
+            return parsed
+
+    def find_definitions(self, name: str, limit: int = 50) -> list[tuple[str, Definition]]:
+        """Find definitions by simple name (`run`) or qualified name (`Agent.run`)."""
+        column = "qualname" if "." in name else "name"
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT path, name, qualname, kind, line, end_line FROM definitions WHERE {column} = ? "
+                "ORDER BY path, line LIMIT ?",
+                (name, limit),
+            ).fetchall()
+        return [(row[0], Definition(*row[1:])) for row in rows]
+
+    def find_references(self, name: str, limit: int = 100) -> list[tuple[str, Reference]]:
+        """Find the lines that use `name`."""
+        name = name.split(".")[-1]
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, name, line FROM refs WHERE name = ? ORDER BY path, line LIMIT ?",
+                (name, limit),
+            ).fetchall()
+        return [(row[0], Reference(row[1], row[2])) for row in rows]
+
+    def outline(self, path: str) -> list[Definition]:
+        """Return the definitions of one file in source order."""
+        relative_path = self._relpath(path)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, qualname, kind, line, end_line FROM definitions WHERE path = ? ORDER BY line",
+                (relative_path,),
+            ).fetchall()
+        return [Definition(*row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_indexes: dict[str, SymbolIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_symbol_index(root: str) -> SymbolIndex:
+    """Return the shared `SymbolIndex` for a workspace root, opening it on first use."""
+    root = os.path.abspath(root)
+    with _indexes_lock:
+        if root not in _indexes:
+            _indexes[root] = SymbolIndex(root)
+        return _indexes[root]
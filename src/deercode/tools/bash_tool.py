@@ -1,10 +1,11 @@
 from typing import Optional
 import pexpect
-import os
 from langchain.tools import tool
+from ..snapshots.snapshot_store import track_tool_writes
+from .workspace import WorkspaceRuntime, resolve_cwd, resolve_root
 
 @tool("bash", parse_docstring=True)
-def bash_tool(command: str, reset_cwd: Optional[bool] = False):
+def bash_tool(command: str, runtime: WorkspaceRuntime, reset_cwd: Optional[bool] = False):
     """Execute a standard bash command in a keep-alive shell, and return the output if successful or error message if failed.
 
     Use this tool to perform:
@@ -22,24 +23,24 @@ def bash_tool(command: str, reset_cwd: Optional[bool] = False):
         command: The command to execute.
         reset_cwd: Whether to reset the current working directory to the project root directory.
     """
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
-    
     if reset_cwd:
-        current_dir = project_root
+        current_dir = resolve_root(runtime)
     else:
-        current_dir = os.getcwd()
+        current_dir = resolve_cwd(runtime)
     
     try:
-        # Use pexpect to execute the command
-        process = pexpect.spawn(
-            "bash", 
-            args=["-c", command],
-            cwd=current_dir,
-            timeout=30
-        )
-        process.expect(pexpect.EOF)
-        output = process.before.decode("utf-8").strip()
-        exit_code = process.wait()
+        # Attribute the files the command changes to this agent thread
+        with track_tool_writes(runtime):
+            # Use pexpect to execute the command
+            process = pexpect.spawn(
+                "bash", 
+                args=["-c", command],
+                cwd=current_dir,
+                timeout=30
+            )
+            process.expect(pexpect.EOF)
+            output = process.before.decode("utf-8").strip()
+            exit_code = process.wait()
         
         if exit_code == 0:
             return output
@@ -1,11 +1,12 @@
 from typing import Optional, Literal
 import subprocess
-import os
 from langchain.tools import tool
+from .workspace import WorkspaceRuntime, resolve_cwd
 
 @tool("grep", parse_docstring=True)
 def grep_tool(
     pattern: str,
+    runtime: WorkspaceRuntime,
     path: Optional[str] = None,
     glob: Optional[str] = None,
     output_mode: Literal[
@@ -99,7 +100,7 @@ def grep_tool(
             capture_output=True,
             text=True,
             check=True,
-            cwd=os.getcwd()
+            cwd=resolve_cwd(runtime)
         )
         
         output = result.stdout.strip()
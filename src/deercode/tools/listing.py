@@ -0,0 +1,142 @@
+from dataclasses import dataclass
+from typing import Callable, Literal, Optional
+import base64
+import fnmatch
+import functools
+import json
+import os
+
+SortKey = Literal["name", "name_desc", "modified", "size"]
+
+
+@dataclass
+class DirectoryPage:
+    """One page of a directory listing."""
+
+    entries: list[os.DirEntry]
+    next_cursor: Optional[str]
+    total: int
+
+
+def encode_cursor(key: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Decode a cursor returned by `list_directory`.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(key, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return key
+
+
+def _matches(name: str, name_filter: str) -> bool:
+    # Glob patterns when they contain wildcards, otherwise a case-insensitive substring match
+    if any(char in name_filter for char in "*?["):
+        return fnmatch.fnmatch(name.lower(), name_filter.lower())
+    return name_filter.lower() in name.lower()
+
+
+def _is_dir(entry: os.DirEntry) -> bool:
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def list_directory(
+    path: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    name_filter: Optional[str] = None,
+    sort: SortKey = "name",
+    dirs_first: bool = True,
+    predicate: Optional[Callable[[str], bool]] = None,
+) -> DirectoryPage:
+    """List one page of a directory with a stable cursor.
+
+    The cursor encodes the sort key of the last returned entry, so the next page starts
+    right after it even if entries are created or deleted in between. Sorting by name
+    only uses the file type reported by `os.scandir`, so `stat` is never called; sorting
+    by `modified` or `size` has to stat every entry that passes the filter.
+
+    Args:
+        path: The directory to list.
+        limit: Maximum number of entries to return. Returns every entry if not specified.
+        cursor: The `next_cursor` of the previous page.
+        name_filter: A glob pattern, or a case-insensitive substring, that names must match.
+        sort: "name", "name_desc", "modified" (newest first) or "size" (largest first).
+        dirs_first: Whether directories are listed before files.
+        predicate: An optional extra filter called with each entry name.
+
+    Raises:
+        ValueError: If `sort` or `cursor` is invalid.
+    """
+    if sort not in ("name", "name_desc", "modified", "size"):
+        raise ValueError(f"Invalid sort '{sort}'. Supported sorts: 'name', 'name_desc', 'modified', 'size'")
+
+    keyed = []
+    with os.scandir(path) as iterator:
+        for entry in iterator:
+            if name_filter and not _matches(entry.name, name_filter):
+                continue
+            if predicate and not predicate(entry.name):
+                continue
+            group = 0 if (dirs_first and _is_dir(entry)) else 1
+            if sort in ("name", "name_desc"):
+                key = [group, entry.name]
+            else:
+                try:
+                    st = entry.stat()
+                    value = st.st_mtime if sort == "modified" else st.st_size
+                except OSError:
+                    value = 0
+                # Negate so that the newest and largest entries come first in ascending order
+                key = [group, -value, entry.name]
+            keyed.append((key, entry))
+
+    keyed.sort(key=lambda item: _comparable(item[0], sort))
+    total = len(keyed)
+    if cursor:
+        last = _comparable(decode_cursor(cursor), sort)
+        try:
+            keyed = [item for item in keyed if _comparable(item[0], sort) > last]
+        except (TypeError, IndexError):
+            raise ValueError(f"Cursor does not match sort '{sort}': {cursor}")
+
+    if limit is not None and len(keyed) > limit:
+        page = keyed[:limit]
+        next_cursor = encode_cursor(page[-1][0]) if page else None
+    else:
+        page = keyed
+        next_cursor = None
+    return DirectoryPage(entries=[entry for _, entry in page], next_cursor=next_cursor, total=total)
+
+
+@functools.total_ordering
+class _Reversed:
+    """Invert the ordering of a value, for descending sort keys inside a tuple."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+
+def _comparable(key: list, sort: SortKey) -> tuple:
+    if sort == "name_desc":
+        if len(key) != 2:
+            raise ValueError(f"Cursor does not match sort '{sort}'")
+        return (key[0], _Reversed(key[1]))
+    return tuple(key)
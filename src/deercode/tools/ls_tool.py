@@ -1,18 +1,29 @@
 from typing import Optional, List
 import os
-import glob
+import fnmatch
 from langchain.tools import tool
+from .listing import list_directory
 
 @tool("ls", parse_docstring=True)
 def ls_tool(
-    path: str, match: Optional[List[str]] = None, ignore: Optional[List[str]] = None
+    path: str,
+    match: Optional[List[str]] = None,
+    ignore: Optional[List[str]] = None,
+    limit: Optional[int] = 200,
+    cursor: Optional[str] = None,
 ) -> str:
     """Lists files and directories in a given path. Optionally provide an array of glob patterns to match and ignore.
 
+    Large directories are returned in pages. When more entries are available, the output ends with
+    a line containing the cursor to pass to the next call.
+
     Args:
         path: The absolute path to list files and directories from. Relative paths are **not** allowed.
-        match: An optional array of glob patterns to match.
-        ignore: An optional array of glob patterns to ignore.
+        match: An optional array of glob patterns to match against entry names, e.g. `*.py`. Patterns match
+               names only, so they must not contain `/`; list the subdirectory instead.
+        ignore: An optional array of glob patterns to ignore, matched against entry names like `match`.
+        limit: Maximum number of entries to return. Defaults to 200.
+        cursor: The cursor returned by the previous call, to fetch the next page.
     """
     # Validate path is absolute
     if not os.path.isabs(path):
@@ -22,48 +33,37 @@ def ls_tool(
     if not os.path.exists(path):
         return f"Error: Path does not exist: {path}"
     
+    # Validate patterns, which only match entry names within the directory
+    for pattern in (match or []) + (ignore or []):
+        if "/" in pattern or os.sep in pattern:
+            return f"Error: Patterns match entry names only and must not contain a path separator, got: {pattern}. List the subdirectory instead."
+    
+    # Validate limit
+    if limit is not None and limit < 1:
+        return f"Error: limit must be at least 1, got: {limit}"
+    
+    def predicate(entry_name: str) -> bool:
+        """Check an entry against the match and ignore patterns."""
+        if match and not any(fnmatch.fnmatch(entry_name, pattern) for pattern in match):
+            return False
+        if ignore and any(fnmatch.fnmatch(entry_name, pattern) for pattern in ignore):
+            return False
+        return True
+    
     try:
-        # Get all entries in the path
-        entries = os.listdir(path)
-        
-        # Full paths for all entries
-        full_paths = [os.path.join(path, entry) for entry in entries]
-        
-        # Filter by match patterns if provided
-        if match:
-            matched_paths = []
-            for pattern in match:
-                # Use glob to find matches
-                glob_pattern = os.path.join(path, pattern)
-                matched_paths.extend(glob.glob(glob_pattern))
-            # Remove duplicates
-            full_paths = list(set(matched_paths))
-        
-        # Filter out ignored patterns if provided
-        if ignore:
-            filtered_paths = []
-            for full_path in full_paths:
-                # Check if path matches any ignore pattern
-                ignore_path = False
-                for pattern in ignore:
-                    if glob.fnmatch.fnmatch(os.path.basename(full_path), pattern):
-                        ignore_path = True
-                        break
-                if not ignore_path:
-                    filtered_paths.append(full_path)
-            full_paths = filtered_paths
-        
-        # Sort the paths
-        full_paths.sort()
+        # Only the entries of the requested page are inspected
+        page = list_directory(path, limit=limit, cursor=cursor, dirs_first=False, predicate=predicate)
         
         # Format the output
         result = []
-        for full_path in full_paths:
-            entry_name = os.path.basename(full_path)
-            if os.path.isdir(full_path):
-                result.append(f"{entry_name}/")
+        for entry in page.entries:
+            if entry.is_dir():
+                result.append(f"{entry.name}/")
             else:
-                result.append(entry_name)
+                result.append(entry.name)
+        
+        if page.next_cursor:
+            result.append(f"... {page.total} entries in total, call again with cursor=\"{page.next_cursor}\" for more")
         
         return "\n".join(result)
     except Exception as e:
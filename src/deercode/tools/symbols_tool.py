@@ -0,0 +1,67 @@
+from typing import Optional, Literal
+from langchain.tools import tool
+from ..symbols.symbol_index import get_symbol_index
+from .workspace import WorkspaceRuntime, resolve_path, resolve_root
+
+@tool("symbols", parse_docstring=True)
+def symbols_tool(
+    action: Literal["definition", "references", "outline"],
+    runtime: WorkspaceRuntime,
+    name: Optional[str] = None,
+    path: Optional[str] = None,
+    head_limit: Optional[int] = 50,
+) -> str:
+    """Look up symbols in the project from a persistent index of Python and JS/TS sources.
+
+    Prefer this tool over repeated `grep` calls when you need to:
+    - Jump to where a class, function, method or variable is defined
+    - Find where a name is used
+    - Get an outline of the definitions in a file before reading it
+
+    Args:
+        action: "definition" finds where `name` is defined,
+                "references" lists the lines that use `name`,
+                "outline" lists the definitions in the file at `path`.
+        name: The symbol to look up, either a simple name (`run`) or a qualified name (`Agent.run`).
+              Required for "definition" and "references".
+        path: The file to outline. Required for "outline". Relative paths are resolved against the working directory.
+        head_limit: Maximum number of results to return. Defaults to 50.
+
+    Returns:
+        One result per line as `path:line kind qualname`, or `path:line` for references,
+        with paths relative to the project root.
+    """
+    try:
+        index = get_symbol_index(resolve_root(runtime))
+        index.refresh()
+        limit = head_limit or 50
+
+        if action == "outline":
+            if not path:
+                return "Error: path is required for the outline action"
+            full_path = resolve_path(runtime, path)
+            definitions = index.outline(full_path)[:limit]
+            if not definitions:
+                return f"No symbols found in {path}"
+            return "\n".join(
+                f"{d.line}-{d.end_line} {d.kind} {d.qualname}" for d in definitions
+            )
+
+        if not name:
+            return f"Error: name is required for the {action} action"
+
+        if action == "definition":
+            results = index.find_definitions(name, limit)
+            if not results:
+                return f"No definition found for {name}"
+            return "\n".join(f"{p}:{d.line} {d.kind} {d.qualname}" for p, d in results)
+
+        if action == "references":
+            results = index.find_references(name, limit)
+            if not results:
+                return f"No references found for {name}"
+            return "\n".join(f"{p}:{r.line}" for p, r in results)
+
+        return f"Error: Invalid action '{action}'. Supported actions: 'definition', 'references', 'outline'"
+    except Exception as e:
+        return f"Error: {str(e)}"
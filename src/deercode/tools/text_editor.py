@@ -1,10 +1,13 @@
 from typing import Optional, Literal
 import os
 from langchain.tools import tool
+from ..snapshots.snapshot_store import report_tool_write
+from .workspace import WorkspaceRuntime
 
 @tool("text_editor", parse_docstring=True)
 def text_editor_tool(
     file_path: str,
+    runtime: WorkspaceRuntime,
     content: Optional[str] = None,
     mode: Literal["write", "append", "read"] = "write"
 ):
@@ -35,6 +38,7 @@ def text_editor_tool(
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             with open(file_path, "w", encoding="utf-8") as f:
                 f.write(content)
+            report_tool_write(runtime, file_path)
             return f"Successfully wrote to file: {file_path}"
         elif mode == "append":
             if content is None:
@@ -43,6 +47,7 @@ def text_editor_tool(
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             with open(file_path, "a", encoding="utf-8") as f:
                 f.write(content)
+            report_tool_write(runtime, file_path)
             return f"Successfully appended to file: {file_path}"
         else:
             return f"Error: Invalid mode '{mode}'. Supported modes: 'write', 'append', 'read'"
@@ -1,6 +1,14 @@
 from enum import Enum
+from typing import Any, Literal, Optional
+from typing_extensions import NotRequired
 from pydantic import BaseModel, Field
+from langchain.agents import AgentState
+from langchain.agents.middleware import AgentMiddleware
 from langchain.tools import tool
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.runtime import Runtime
+from langgraph.types import Command
+from .workspace import WorkspaceRuntime
 
 class TodoStatus(str, Enum):
     pending = "pending"
@@ -21,11 +29,141 @@ class TodoItem(BaseModel):
     priority: TodoPriority = Field(default=TodoPriority.medium)
     status: TodoStatus = Field(default=TodoStatus.pending)
 
+class TodoOperation(BaseModel):
+    """A single change to the TODO list."""
+
+    op: Literal["add", "update", "remove"]
+    id: int = Field(..., ge=0)
+    content: Optional[str] = Field(default=None, min_length=1)
+    priority: Optional[TodoPriority] = None
+    status: Optional[TodoStatus] = None
+
+class TodoState(AgentState):
+    """Agent state extended with the TODO list, its compact rendering and the last rendering shown to the model."""
+
+    todos: NotRequired[list[dict]]
+    todo_summary: NotRequired[str]
+    todo_summary_shown: NotRequired[str]
+
+_STATUS_MARKERS = {
+    TodoStatus.pending: "[ ]",
+    TodoStatus.in_progress: "[>]",
+    TodoStatus.completed: "[x]",
+    TodoStatus.cancelled: "[-]",
+}
+
+def render_todo(item: TodoItem) -> str:
+    """Render one item as a single compact line, e.g. `#2 [>] !high Write tests`."""
+    priority = "" if item.priority == TodoPriority.medium else f"!{item.priority.value} "
+    return f"#{item.id} {_STATUS_MARKERS[item.status]} {priority}{item.content}"
+
+def render_todos(items: list[TodoItem]) -> str:
+    return "\n".join(render_todo(item) for item in items)
+
+def apply_todo_operations(items: list[TodoItem], operations: list[TodoOperation]) -> tuple[list[TodoItem], list[str]]:
+    """Apply the operations in order and return the new list with one line per change.
+
+    Raises:
+        ValueError: If an operation refers to a missing id or adds a duplicate one.
+    """
+    by_id = {item.id: item for item in items}
+    changes = []
+    for operation in operations:
+        if operation.op == "add":
+            if operation.id in by_id:
+                raise ValueError(f"TODO #{operation.id} already exists")
+            if not operation.content:
+                raise ValueError(f"content is required to add TODO #{operation.id}")
+            item = TodoItem(
+                id=operation.id,
+                content=operation.content,
+                priority=operation.priority or TodoPriority.medium,
+                status=operation.status or TodoStatus.pending,
+            )
+            by_id[item.id] = item
+            changes.append(f"+ {render_todo(item)}")
+        elif operation.id not in by_id:
+            raise ValueError(f"TODO #{operation.id} does not exist")
+        elif operation.op == "update":
+            update = operation.model_dump(include={"content", "priority", "status"}, exclude_none=True)
+            item = by_id[operation.id].model_copy(update=update)
+            by_id[item.id] = item
+            changes.append(f"~ {render_todo(item)}")
+        else:
+            item = by_id.pop(operation.id)
+            changes.append(f"- #{item.id}")
+    return sorted(by_id.values(), key=lambda item: item.id), changes
+
 @tool("todo_write", parse_docstring=True)
-def todo_write_tool(items: list[TodoItem]):
-    """Update the entire TODO list with the latest items.
+def todo_write_tool(operations: list[TodoOperation], runtime: WorkspaceRuntime):
+    """Change the TODO list with incremental operations instead of resending the whole list.
+
+    Each operation targets one item by `id`:
+    - "add": create an item; `content` is required, `priority` and `status` are optional.
+    - "update": change any of `content`, `priority` or `status` of an existing item.
+    - "remove": delete an item.
+
+    After the list changes, the full list is shown to you once, so never repeat unchanged items.
 
     Args:
-        items: A list of TodoItem objects.
+        operations: A list of TodoOperation objects, applied in order.
+    """
+    items = [TodoItem(**item) for item in runtime.state.get("todos", [])]
+    try:
+        items, changes = apply_todo_operations(items, operations)
+    except ValueError as e:
+        return f"Error: {str(e)}. The TODO list was not changed."
+    return Command(update={
+        "todos": [item.model_dump(mode="json") for item in items],
+        "todo_summary": render_todos(items),
+        "messages": [ToolMessage("\n".join(changes), tool_call_id=runtime.tool_call_id)],
+    })
+
+class TodoMiddleware(AgentMiddleware):
+    """Keep the TODO list in the graph state and show its compact rendering to the model.
+
+    The rendering is recomputed by `todo_write` only when the list changes, and is appended
+    to the message history once, before the next model call. The system prompt and the
+    earlier messages stay untouched, so the provider's prompt cache keeps matching and a
+    step costs the tokens of its changes rather than of the whole plan.
+
+    Only one `todo_write` call runs per model turn: parallel calls would all start from the
+    same list and write the state keys in the same step, so the extra ones are answered
+    with an error before the tools run.
     """
-    return f"Successfully updated the TODO list with {len(items)} items."
\ No newline at end of file
+
+    state_schema = TodoState
+
+    def before_model(self, state: TodoState, runtime: Runtime) -> Optional[dict[str, Any]]:
+        summary = state.get("todo_summary")
+        if summary is None or summary == state.get("todo_summary_shown"):
+            return None
+        return {
+            "messages": [HumanMessage(f"## Current TODO list\n{summary or '(empty)'}")],
+            "todo_summary_shown": summary,
+        }
+
+    async def abefore_model(self, state: TodoState, runtime: Runtime) -> Optional[dict[str, Any]]:
+        return self.before_model(state, runtime)
+
+    def after_model(self, state: TodoState, runtime: Runtime) -> Optional[dict[str, Any]]:
+        last_ai_message = next((m for m in reversed(state["messages"]) if isinstance(m, AIMessage)), None)
+        if last_ai_message is None:
+            return None
+        calls = [call for call in last_ai_message.tool_calls if call["name"] == "todo_write"]
+        if len(calls) <= 1:
+            return None
+        return {
+            "messages": [
+                ToolMessage(
+                    "Error: todo_write must not be called in parallel. Only the first call of this "
+                    "turn was applied; send the remaining operations in a single call after it.",
+                    tool_call_id=call["id"],
+                    status="error",
+                )
+                for call in calls[1:]
+            ],
+        }
+
+    async def aafter_model(self, state: TodoState, runtime: Runtime) -> Optional[dict[str, Any]]:
+        return self.after_model(state, runtime)
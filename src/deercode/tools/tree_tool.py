@@ -1,9 +1,11 @@
 from typing import Optional
 import os
 from langchain.tools import tool
+from .workspace import WorkspaceRuntime, resolve_path
 
 @tool("tree", parse_docstring=True)
 def tree_tool(
+    runtime: WorkspaceRuntime,
     path: Optional[str] = None,
     max_depth: Optional[int] = 3,
 ) -> str:
@@ -19,9 +21,8 @@ def tree_tool(
     Returns:
         A tree-structured view of the directory as a string.
     """
-    # Set default path if not provided
-    if path is None:
-        path = os.getcwd()
+    # Resolve the path against the session's working directory
+    path = resolve_path(runtime, path)
     
     # Validate path exists
     if not os.path.exists(path):
@@ -0,0 +1,75 @@
+from dataclasses import dataclass
+from typing import Any, Optional
+import hashlib
+import os
+from langchain.tools import ToolRuntime
+
+# Used when the agent runs without a workspace context, e.g. under `langgraph dev`
+DEFAULT_PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
+
+
+@dataclass
+class WorkspaceContext:
+    """The workspace of one agent session, passed to the tools through the agent runtime.
+
+    Tools must resolve paths against this context instead of the process-global
+    `os.getcwd()`, so that concurrent sessions never see each other's directories.
+
+    Raises:
+        ValueError: If `cwd` is outside `root`.
+    """
+
+    root: str
+    cwd: Optional[str] = None
+
+    def __post_init__(self):
+        self.root = os.path.abspath(self.root)
+        if self.cwd is None:
+            self.cwd = self.root
+            return
+        # Relative paths are resolved against the root; `..` must not lead out of it
+        cwd = os.path.normpath(os.path.join(self.root, self.cwd))
+        if os.path.commonpath([self.root, cwd]) != self.root:
+            raise ValueError(f"Working directory must be inside the workspace root {self.root}: {self.cwd}")
+        self.cwd = cwd
+
+
+def workspace_state_dir(root: str) -> str:
+    """Return the directory that holds DeerCode's own data about a workspace.
+
+    It is kept outside the workspace, so that the file tree, the tools and the file API
+    never see or modify it. The base directory is `~/.deercode` unless `DEERCODE_STATE_DIR` is set.
+    """
+    root = os.path.abspath(root)
+    base = os.getenv("DEERCODE_STATE_DIR") or os.path.join(os.path.expanduser("~"), ".deercode")
+    digest = hashlib.sha256(root.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(base, "workspaces", f"{os.path.basename(root) or 'root'}-{digest}")
+
+
+# Annotate tool parameters with this type to have the session's runtime injected
+WorkspaceRuntime = ToolRuntime[WorkspaceContext, Any]
+
+
+def _context(runtime: Optional[ToolRuntime]) -> Optional[WorkspaceContext]:
+    context = getattr(runtime, "context", None)
+    return context if isinstance(context, WorkspaceContext) else None
+
+
+def resolve_root(runtime: Optional[ToolRuntime]) -> str:
+    """Return the workspace root of the session, or the project root if there is none."""
+    context = _context(runtime)
+    return context.root if context else DEFAULT_PROJECT_ROOT
+
+
+def resolve_cwd(runtime: Optional[ToolRuntime]) -> str:
+    """Return the working directory of the session, or the process cwd if there is none."""
+    context = _context(runtime)
+    return context.cwd if context else os.getcwd()
+
+
+def resolve_path(runtime: Optional[ToolRuntime], path: Optional[str]) -> str:
+    """Resolve a possibly relative path against the session's working directory."""
+    cwd = resolve_cwd(runtime)
+    if not path:
+        return cwd
+    return os.path.normpath(os.path.join(cwd, path))
@@ -17,9 +17,11 @@ interface FileNode {
 }
 
 interface FileChangeEvent {
-  type: 'created' | 'modified' | 'deleted' | 'moved';
+  type: 'created' | 'modified' | 'deleted' | 'moved' | 'batch';
   path: string;
   dest_path?: string;
+  // 批量操作合并后的变化列表，仅 type 为 'batch' 时存在
+  changes?: Omit<FileChangeEvent, 'timestamp' | 'changes'>[];
   timestamp: number;
 }
 